@@ -1,17 +1,22 @@
+import os
+
+import numpy as np
+
 from Constant import Constant
-from Moment import Moment
+from FrameWriter import FrameWriter
 from Team import Team
-import matplotlib.pyplot as plt
-from matplotlib import animation
-from matplotlib.patches import Circle, Rectangle, Arc
+from Trajectory import Trajectory
+
+COURT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'court.png')
+# The frame rate the animation plays at when shown
+FPS = 1000 // Constant.INTERVAL
 
 
 class Event:
     """A class for handling and showing events"""
 
     def __init__(self, event):
-        moments = event['moments']
-        self.moments = [Moment(moment) for moment in moments]
+        self.trajectory = Trajectory.from_moments(event['moments'])
         home_players = event['home']['players']
         guest_players = event['visitor']['players']
         players = home_players + guest_players
@@ -23,29 +28,50 @@ class Event:
         # Example: 101108: ['Chris Paul', '3']
         self.player_ids_dict = dict(zip(player_ids, values))
 
-    def update_radius(self, i, player_circles, ball_circle, annotations, clock_info):
-        moment = self.moments[i]
+    @classmethod
+    def from_trajectory(cls, trajectory, player_ids_dict):
+        """Builds an event around an already parsed trajectory and a shared player dictionary"""
+        event = cls.__new__(cls)
+        event.trajectory = trajectory
+        event.player_ids_dict = player_ids_dict
+        return event
+
+    @property
+    def moments(self):
+        # Moment objects are built on demand from the trajectory arrays
+        return self.trajectory
+
+    def clock_texts(self):
+        """The clock text of every frame, formatted once up front"""
+        trajectory = self.trajectory
+        game_clock = trajectory.game_clock.astype(int).tolist()
+        return ['Quarter {:d}\n {:02d}:{:02d}\n {:03.1f}'.format(quarter, clock % 3600 // 60, clock % 60, shot_clock)
+                for quarter, clock, shot_clock in
+                zip(trajectory.quarter.tolist(), game_clock, trajectory.shot_clock.tolist())]
+
+    def update_radius(self, i, player_circles, ball_circle, annotations, clock_info, clock_texts=None):
+        trajectory = self.trajectory
+        ball = trajectory.ball[i]
+        players = trajectory.players[i]
         for j, circle in enumerate(player_circles):
-            circle.center = moment.players[j].x, moment.players[j].y
+            circle.center = players[j, 0], players[j, 1]
             annotations[j].set_position(circle.center)
-            clock_test = 'Quarter {:d}\n {:02d}:{:02d}\n {:03.1f}'.format(
-                         moment.quarter,
-                         int(moment.game_clock) % 3600 // 60,
-                         int(moment.game_clock) % 60,
-                         moment.shot_clock)
-            clock_info.set_text(clock_test)
-        ball_circle.center = moment.ball.x, moment.ball.y
-        ball_circle.radius = moment.ball.radius / Constant.NORMALIZATION_COEF
-        return player_circles, ball_circle
+        if clock_texts is None:
+            clock_texts = self.clock_texts()
+        clock_info.set_text(clock_texts[i])
+        ball_circle.center = ball[0], ball[1]
+        ball_circle.radius = ball[2] / Constant.NORMALIZATION_COEF
+        return [*player_circles, ball_circle, *annotations, clock_info]
+
+    def draw_court(self, ax):
+        """Draws the court and the roster table on ax, returns the artists that move every frame"""
+        from matplotlib.image import imread
+        from matplotlib.patches import Circle
 
-    def show(self):
         # Leave some space for inbound passes
-        ax = plt.axes(xlim=(Constant.X_MIN,
-                            Constant.X_MAX),
-                      ylim=(Constant.Y_MIN,
-                            Constant.Y_MAX))
+        ax.set_xlim(Constant.X_MIN, Constant.X_MAX)
+        ax.set_ylim(Constant.Y_MIN, Constant.Y_MAX)
         ax.axis('off')
-        fig = plt.gcf()
         ax.grid(False)  # Remove grid
         start_moment = self.moments[0]
         player_dict = self.player_ids_dict
@@ -72,7 +98,7 @@ class Event:
         guest_players = [' #'.join([player_dict[player.id][0], player_dict[player.id][1]]) for player in sorted_players[5:]]
         players_data = list(zip(home_players, guest_players))
 
-        table = plt.table(cellText=players_data,
+        table = ax.table(cellText=players_data,
                               colLabels=column_labels,
                               colColours=column_colours,
                               colWidths=[Constant.COL_WIDTH, Constant.COL_WIDTH],
@@ -85,20 +111,74 @@ class Event:
         for cell in table_cells:
             cell._text.set_color('white')
 
-        player_circles = [plt.Circle((0, 0), Constant.PLAYER_CIRCLE_SIZE, color=player.color)
+        player_circles = [Circle((0, 0), Constant.PLAYER_CIRCLE_SIZE, color=player.color)
                           for player in start_moment.players]
-        ball_circle = plt.Circle((0, 0), Constant.PLAYER_CIRCLE_SIZE,
+        ball_circle = Circle((0, 0), Constant.PLAYER_CIRCLE_SIZE,
                                  color=start_moment.ball.color)
         for circle in player_circles:
             ax.add_patch(circle)
         ax.add_patch(ball_circle)
 
+        court = imread(COURT_PATH)
+        ax.imshow(court, zorder=0, extent=[Constant.X_MIN, Constant.X_MAX - Constant.DIFF,
+                                           Constant.Y_MAX, Constant.Y_MIN])
+        return player_circles, ball_circle, annotations, clock_info
+
+    def show(self):
+        # matplotlib is only needed for showing, parsing events does not import it
+        import matplotlib.pyplot as plt
+        from matplotlib import animation
+
+        fig = plt.figure()
+        ax = fig.add_subplot()
+        player_circles, ball_circle, annotations, clock_info = self.draw_court(ax)
         anim = animation.FuncAnimation(
                          fig, self.update_radius,
-                         fargs=(player_circles, ball_circle, annotations, clock_info),
-                         frames=len(self.moments), interval=Constant.INTERVAL)
-        court = plt.imread("court.png")
-        plt.imshow(court, zorder=0, extent=[Constant.X_MIN, Constant.X_MAX - Constant.DIFF,
-                                            Constant.Y_MAX, Constant.Y_MIN])
+                         fargs=(player_circles, ball_circle, annotations, clock_info, self.clock_texts()),
+                         frames=len(self.moments), interval=Constant.INTERVAL, blit=True)
         plt.show()
-        anim.save("animation.mp4", "ffmpeg")
+        return anim
+
+    def frames(self, dpi=100):
+        """Renders every frame headless, yields them as (height, width, 4) uint8 RGBA arrays
+
+        The court, the table and the axes are drawn once and every frame only
+        redraws the moving artists over a copy of them.
+        """
+        # The Agg canvas is used directly, no pyplot backend or display is needed
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        fig = Figure(dpi=dpi)
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        player_circles, ball_circle, annotations, clock_info = self.draw_court(ax)
+        animated = [*player_circles, ball_circle, *annotations, clock_info]
+        for artist in animated:
+            artist.set_animated(True)
+        canvas.draw()
+        background = canvas.copy_from_bbox(fig.bbox)
+        clock_texts = self.clock_texts()
+        for i in range(len(self.trajectory)):
+            canvas.restore_region(background)
+            for artist in self.update_radius(i, player_circles, ball_circle, annotations, clock_info, clock_texts):
+                ax.draw_artist(artist)
+            yield np.asarray(canvas.buffer_rgba())
+
+    def save(self, path, fps=FPS, dpi=100, renderer='matplotlib'):
+        """Writes the animation to path without a display, .gif with Pillow and other formats with ffmpeg
+
+        renderer 'raster' draws with RasterRenderer instead of matplotlib, an
+        order of magnitude faster but without the roster table.
+        """
+        if renderer == 'raster':
+            from RasterRenderer import RasterRenderer
+
+            return RasterRenderer().save(self.trajectory, self.player_ids_dict, self.clock_texts(), path, fps)
+        frames = self.frames(dpi)
+        first = next(frames)
+        with FrameWriter(path, first.shape[1], first.shape[0], fps) as writer:
+            writer.write(first)
+            for frame in frames:
+                writer.write(frame)
+        return path
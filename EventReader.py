@@ -0,0 +1,156 @@
+import io
+import json
+import os
+import re
+
+# A json string, an unterminated string at the end of the buffer, or a bracket
+_TOKEN = re.compile(rb'(?P<string>"(?:[^"\\]|\\.)*")|(?P<partial>")|(?P<open>[\[{])|(?P<close>[\]}])')
+_SEPARATORS = re.compile(rb'[\s,]*')
+_EVENTS_KEY = re.compile(rb'"events"\s*:\s*\[')
+
+
+class EventReader:
+    """A class for reading the events of a SportVU game json one at a time
+
+    Only the event under the cursor is kept in memory. Events that are skipped
+    over are bracket-matched but never decoded, and their byte offsets are
+    remembered so that seeking back to them is cheap on seekable files.
+    """
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, source, chunk_size=CHUNK_SIZE):
+        if isinstance(source, (str, os.PathLike)):
+            self._file = open(source, 'rb')
+            self._owns_file = True
+        else:
+            self._file = source
+            self._owns_file = False
+        self._chunk_size = chunk_size
+        self._buffer = b''
+        self._offset = 0  # absolute offset of self._buffer[0]
+        self._pos = 0  # cursor into self._buffer
+        self._index = 0  # index of the event under the cursor
+        self._offsets = []  # absolute offsets of the events seen so far
+        self._total = None
+        self.header = self._read_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._owns_file:
+            self._file.close()
+
+    def _fill(self):
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            return False
+        # Drop everything before the cursor, the buffer only holds the event being read
+        self._offset += self._pos
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _read_header(self):
+        match = _EVENTS_KEY.search(self._buffer)
+        while match is None:
+            if not self._fill():
+                raise ValueError('No events array found in SportVU json')
+            match = _EVENTS_KEY.search(self._buffer)
+        # Every key before the events array, e.g. {'gameid': '0021500061', 'gamedate': '2015-11-01'}
+        header = json.loads(self._buffer[:match.start()] + b'"events":[]}')
+        del header['events']
+        self._pos = match.end()
+        return header
+
+    def _peek(self):
+        while True:
+            self._pos = _SEPARATORS.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos:self._pos + 1]
+            if not self._fill():
+                return b''
+
+    def _scan(self):
+        """Returns the buffer position right after the json value under the cursor"""
+        depth = 0
+        scan = self._pos
+        while True:
+            for match in _TOKEN.finditer(self._buffer, scan):
+                kind = match.lastgroup
+                if kind == 'partial':
+                    break
+                scan = match.end()
+                if kind == 'open':
+                    depth += 1
+                elif kind == 'close':
+                    depth -= 1
+                    if depth == 0:
+                        return scan
+            scanned = scan - self._pos
+            if not self._fill():
+                raise ValueError('Unexpected end of SportVU json')
+            scan = self._pos + scanned
+
+    def _next(self, decode=True):
+        """Reads the event under the cursor and moves past it, returns None at the end"""
+        if self._peek() in (b']', b''):
+            self._total = self._index
+            return None
+        if self._index == len(self._offsets):
+            self._offsets.append(self._offset + self._pos)
+        end = self._scan()
+        event = json.loads(self._buffer[self._pos:end]) if decode else True
+        self._pos = end
+        self._index += 1
+        return event
+
+    def _seek(self, index):
+        if index < self._index or index < len(self._offsets):
+            if index == self._index:
+                return
+            if not self._file.seekable():
+                raise io.UnsupportedOperation('Cannot seek backwards in a non seekable SportVU stream')
+            known = min(index, len(self._offsets) - 1)
+            self._file.seek(self._offsets[known])
+            self._buffer = b''
+            self._offset = self._offsets[known]
+            self._pos = 0
+            self._index = known
+        while self._index < index:
+            if self._next(decode=False) is None:
+                raise IndexError('event index out of range')
+
+    def event(self, index):
+        if index < 0:
+            index += self.count()
+        self._seek(index)
+        event = self._next()
+        if event is None:
+            raise IndexError('event index out of range')
+        return event
+
+    def events(self, start=0):
+        self._seek(start)
+        while True:
+            event = self._next()
+            if event is None:
+                return
+            yield event
+
+    def __iter__(self):
+        return self.events()
+
+    def count(self):
+        """Counts the events without decoding them"""
+        if self._total is None:
+            index = self._index
+            while self._next(decode=False) is not None:
+                pass
+            # Come back to where the cursor was so that the next read is unaffected
+            if index < self._total and self._file.seekable():
+                self._seek(index)
+        return self._total
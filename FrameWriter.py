@@ -0,0 +1,75 @@
+import os
+import shutil
+import subprocess
+
+import numpy as np
+
+
+class FrameWriter:
+    """A class for writing RGBA frames straight to an animation file
+
+    .gif files are encoded in process with Pillow and streamed to the file
+    frame by frame, every other format is encoded by ffmpeg reading the raw
+    frames from a pipe, so no matplotlib writer or figure is involved.
+    """
+
+    def __init__(self, path, width, height, fps):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self._process = None
+        self._gif = None
+        self._palette = None
+        if os.path.splitext(path)[1].lower() == '.gif':
+            self._gif = open(path, 'wb')
+            return
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            raise RuntimeError(f'ffmpeg is needed to write {path}, install it or write a .gif instead')
+        self._process = subprocess.Popen(
+            [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgba',
+             '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+             # yuv420p plays everywhere but needs even dimensions
+             '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', path],
+            stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        """Writes one (height, width, 4) uint8 frame"""
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if frame.shape != (self.height, self.width, 4):
+            raise ValueError(f'Expected a {self.height}x{self.width} RGBA frame, got {frame.shape}')
+        if self._process is not None:
+            self._process.stdin.write(frame.tobytes())
+            return
+        from PIL import GifImagePlugin, Image
+
+        image = Image.fromarray(frame[..., :3])
+        duration = round(1000 / self.fps)
+        # Quantizing to the first frame's palette is much faster than a new palette per frame,
+        # the court and team colors do not change within an animation
+        first = self._palette is None
+        if first:
+            self._palette = image.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+        image = image.quantize(palette=self._palette, dither=Image.Dither.NONE)
+        if first:
+            header, _ = GifImagePlugin.getheader(image, info={'loop': 0, 'duration': duration})
+            self._gif.writelines(header)
+        self._gif.writelines(GifImagePlugin.getdata(image, duration=duration))
+
+    def close(self):
+        if self._process is not None:
+            self._process.stdin.close()
+            if self._process.wait() != 0:
+                raise RuntimeError(f'ffmpeg failed to write {self.path}')
+            self._process = None
+        elif self._gif is not None:
+            self._gif.write(b';')  # GIF trailer
+            self._gif.close()
+            self._gif = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,30 +1,43 @@
-import pandas as pd
 from Event import Event
+from EventReader import EventReader
 from Team import Team
 from Constant import Constant
 
 
 class Game:
     """A class for keeping info about the games"""
-    def __init__(self, path_to_json, event_index):
+    def __init__(self, path_to_json, event_index, session=None):
         # self.events = None
         self.home_team = None
         self.guest_team = None
         self.event = None
         self.path_to_json = path_to_json
         self.event_index = event_index
+        self.session = session
 
     def read_json(self):
-        data_frame = pd.read_json(self.path_to_json)
-        last_default_index = len(data_frame) - 1
-        #self.event_index = min(self.event_index, last_default_index)
-        index = self.event_index
+        if self.session is not None:
+            # The game was already parsed, just take a view of the event
+            self.event = self.session.event(self.event_index)
+            self.home_team = self.session.home_team
+            self.guest_team = self.session.guest_team
+            return
+
+        # Only the requested event is decoded, the others are skipped over
+        with EventReader(self.path_to_json) as reader:
+            #self.event_index = min(self.event_index, last_default_index)
+            index = self.event_index
+            event = reader.event(index)
+            last_default_index = reader.count() - 1
 
         print(Constant.MESSAGE + str(last_default_index))
-        event = data_frame['events'][index]
         self.event = Event(event)
         self.home_team = Team(event['home']['teamid'])
         self.guest_team = Team(event['visitor']['teamid'])
 
     def start(self):
         self.event.show()
+
+    def save(self, path, **kwargs):
+        """Writes the event's animation to path without showing it"""
+        return self.event.save(path, **kwargs)
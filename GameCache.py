@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+
+from GameSession import GameSession
+from Team import Team
+from Trajectory import Trajectory
+
+# <sha256 of the archive>-v<parser version>
+_ENTRY_NAME = re.compile(r'[0-9a-f]{64}-v\d+$')
+
+
+def parse_game(path):
+    """Parses a game json, or the json inside a SportVU .7z archive"""
+    if not str(path).endswith('.7z'):
+        return GameSession.from_json(path)
+    from SevenZipStream import SevenZipStream
+    # Parse while decompressing, the json is never written to disk
+    with SevenZipStream(path) as stream:
+        return GameSession.from_json(stream)
+
+
+class GameCache:
+    """A class for caching parsed games on disk, keyed by archive content
+
+    Every entry is a directory of .npy files, one per trajectory column, plus
+    a json file with the event ids, teams and rosters. Arrays are memory
+    mapped when an entry is opened, so a cached game loads in milliseconds.
+    The least recently used entries are evicted once the cache grows past
+    max_bytes.
+    """
+    # Bump whenever parsing changes, so that stale entries are never read
+    PARSER_VERSION = 1
+    DEFAULT_DIR = './data/cache'
+    DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+
+    def __init__(self, cache_dir=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def archive_hash(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def entry_path(self, path):
+        return os.path.join(self.cache_dir, f"{self.archive_hash(path)}-v{self.PARSER_VERSION}")
+
+    def load(self, path):
+        """Returns the GameSession of path, parsing and caching it on a miss"""
+        entry_path = self.entry_path(path)
+        if os.path.isdir(entry_path):
+            session = self._read(entry_path)
+            # The entry's mtime is its last use, for the LRU eviction
+            os.utime(entry_path)
+            return session
+        session = parse_game(path)
+        self._write(entry_path, session)
+        self.evict()
+        return session
+
+    def _write(self, entry_path, session):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write next to the final place and rename, so readers never see half an entry
+        partial_path = tempfile.mkdtemp(dir=self.cache_dir, prefix='.partial-')
+        try:
+            for column in Trajectory.COLUMNS:
+                np.save(os.path.join(partial_path, column + '.npy'), getattr(session.trajectory, column))
+            np.save(os.path.join(partial_path, 'event_offsets.npy'), session.event_offsets)
+            with open(os.path.join(partial_path, 'game.json'), 'w') as file:
+                json.dump({
+                    'header': dict(session.header),
+                    'event_ids': session.event_ids,
+                    'home_team_id': session.home_team.id,
+                    'guest_team_id': session.guest_team.id,
+                    'rosters': [[team_id, player_ids] for team_id, player_ids in session.rosters.items()],
+                    'players': [[player_id, *values] for player_id, values in session.player_ids_dict.items()],
+                }, file)
+            os.rename(partial_path, entry_path)
+        except OSError:
+            shutil.rmtree(partial_path, ignore_errors=True)
+            if not os.path.isdir(entry_path):
+                raise
+
+    @staticmethod
+    def _read(entry_path):
+        trajectory = Trajectory(*(np.load(os.path.join(entry_path, column + '.npy'), mmap_mode='r')
+                                  for column in Trajectory.COLUMNS))
+        event_offsets = np.load(os.path.join(entry_path, 'event_offsets.npy'))
+        with open(os.path.join(entry_path, 'game.json')) as file:
+            game = json.load(file)
+        rosters = {team_id: player_ids for team_id, player_ids in game['rosters']}
+        player_ids_dict = {player_id: (name, jersey) for player_id, name, jersey in game['players']}
+        return GameSession(game['header'], trajectory, event_offsets, game['event_ids'],
+                           Team(game['home_team_id']), Team(game['guest_team_id']), rosters, player_ids_dict)
+
+    def entries(self):
+        """Returns (last use, size in bytes, path) of every entry, least recently used first"""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, name)
+            if not _ENTRY_NAME.match(name) or not os.path.isdir(entry_path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(entry_path))
+            entries.append((os.stat(entry_path).st_mtime, size, entry_path))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('.partial-') or _ENTRY_NAME.match(name):
+                shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
@@ -0,0 +1,84 @@
+from types import MappingProxyType
+
+import numpy as np
+
+from Event import Event
+from EventReader import EventReader
+from Team import Team
+from Timeline import Timeline
+from Trajectory import Trajectory
+
+
+class GameSession:
+    """A class for parsing a game once and sharing it across all of its events
+
+    Every event is a read-only view into one game-wide trajectory, and the
+    rosters and team metadata are shared by all of them.
+    """
+
+    def __init__(self, header, trajectory, event_offsets, event_ids, home_team, guest_team, rosters,
+                 player_ids_dict):
+        for column in Trajectory.COLUMNS:
+            getattr(trajectory, column).flags.writeable = False
+        self.header = MappingProxyType(dict(header))  # e.g. {'gameid': '0021500061', 'gamedate': '2015-11-01'}
+        self.trajectory = trajectory
+        self.event_offsets = event_offsets  # (events + 1,) event i is trajectory[event_offsets[i]:event_offsets[i + 1]]
+        self.event_ids = tuple(event_ids)  # eventId of every event in the json
+        self.home_team = home_team
+        self.guest_team = guest_team
+        self.rosters = MappingProxyType({team_id: tuple(player_ids) for team_id, player_ids in rosters.items()})
+        # Example: 101108: ('Chris Paul', '3')
+        self.player_ids_dict = MappingProxyType(dict(player_ids_dict))
+        self._timeline = None
+
+    @classmethod
+    def from_json(cls, path_to_json):
+        trajectories = []
+        event_ids = []
+        rosters = {}
+        player_ids_dict = {}
+        home_team_id = guest_team_id = None
+        with EventReader(path_to_json) as reader:
+            for event in reader:
+                trajectories.append(Trajectory.from_moments(event['moments']))
+                event_ids.append(event['eventId'])
+                home_team_id = event['home']['teamid']
+                guest_team_id = event['visitor']['teamid']
+                for team in (event['home'], event['visitor']):
+                    roster = rosters.setdefault(team['teamid'], [])
+                    for player in team['players']:
+                        if player['playerid'] not in player_ids_dict:
+                            roster.append(player['playerid'])
+                            player_ids_dict[player['playerid']] = (
+                                " ".join([player['firstname'], player['lastname']]), player['jersey'])
+            header = reader.header
+        if home_team_id is None:
+            raise ValueError('No events found in ' + str(path_to_json))
+
+        event_offsets = np.zeros(len(trajectories) + 1, dtype=np.int64)
+        np.cumsum([len(trajectory) for trajectory in trajectories], out=event_offsets[1:])
+        return cls(header, Trajectory.concatenate(trajectories), event_offsets, event_ids,
+                   Team(home_team_id), Team(guest_team_id), rosters, player_ids_dict)
+
+    def __len__(self):
+        return len(self.event_ids)
+
+    def event_trajectory(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('event index out of range')
+        return self.trajectory[self.event_offsets[index]:self.event_offsets[index + 1]]
+
+    def event(self, index):
+        return Event.from_trajectory(self.event_trajectory(index), self.player_ids_dict)
+
+    def timeline(self, event_indices=None):
+        """Returns the deduplicated timeline of the given events, all of them by default"""
+        if event_indices is None:
+            if self._timeline is None:
+                self._timeline = self.timeline(range(len(self)))
+            return self._timeline
+        event_indices = list(event_indices)
+        return Timeline.from_trajectories([self.event_trajectory(index) for index in event_indices],
+                                          event_indices)
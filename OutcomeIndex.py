@@ -0,0 +1,139 @@
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+COLUMNS = ['Game', 'Quarter', 'SecLeft', 'Outcome', 'Weight']
+
+
+def group_game(rows):
+    """Last outcome of every (Quarter, SecLeft) among the rows of one game, in game order"""
+    grouped = rows[COLUMNS[1:]].groupby(['Quarter', 'SecLeft']).last().reset_index()
+    return grouped.sort_values(['Quarter', 'SecLeft'], ascending=[True, False], kind='stable')
+
+
+def index_path_of(csv_path):
+    # espn/outcomes/NBA_PBP_2015-16.csv.gz -> espn/outcomes/NBA_PBP_2015-16.index.npz
+    name = os.path.basename(csv_path).split('.')[0]
+    return os.path.join(os.path.dirname(csv_path), name + '.index.npz')
+
+
+class OutcomeIndex:
+    """A class for looking up the ESPN outcomes of one game without reading the whole season
+
+    The season csv written by espn/outcome.py is grouped by game once and
+    saved as an .npz with one set of arrays per game, already reduced to the
+    last outcome of every (Quarter, SecLeft) and sorted from the start of the
+    game to its end. Looking a game up only reads that game's arrays.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self._data = np.load(index_path)
+        self.games = frozenset(self._data['games'].tolist())
+
+    @staticmethod
+    def build(csv_path, index_path=None):
+        """Writes the index of a season csv, next to it by default, and returns its path"""
+        import pandas as pd
+
+        if index_path is None:
+            index_path = index_path_of(csv_path)
+        espn_data = pd.read_csv(csv_path, compression='infer', usecols=COLUMNS)
+        # The same last() as a per game groupby on (Quarter, SecLeft), it skips missing outcomes
+        grouped = espn_data[COLUMNS].groupby(['Game', 'Quarter', 'SecLeft']).last().reset_index()
+        # Starts from (1, 720) to (1, ~0) to (2, 720)... eventually (4, ~0)
+        grouped = grouped.sort_values(['Game', 'Quarter', 'SecLeft'], ascending=[True, True, False], kind='stable')
+        with OutcomeIndexWriter(index_path) as writer:
+            for game, rows in grouped.groupby('Game', sort=False):
+                writer.add(game, rows)
+        return index_path
+
+    @classmethod
+    def for_csv(cls, csv_path):
+        """Opens the index of a season csv, building it first when it is missing or older than the csv"""
+        index_path = index_path_of(csv_path)
+        if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(csv_path):
+            print("Indexing espn data from", csv_path)
+            cls.build(csv_path, index_path)
+        return cls(index_path)
+
+    def __contains__(self, game):
+        return game in self.games
+
+    def events(self, game):
+        """(Quarter, SecLeft) to {Outcome, Weight} of a game, ordered from the start of the game"""
+        if game not in self.games:
+            return {}
+        quarters = self._data[game + '_quarter'].tolist()
+        sec_lefts = self._data[game + '_sec_left'].tolist()
+        outcomes = self._data[game + '_outcome'].tolist()
+        missing = self._data[game + '_outcome_missing'].tolist()
+        weights = self._data[game + '_weight'].tolist()
+        return {(quarter, sec_left): {'Outcome': float('nan') if is_missing else outcome, 'Weight': weight}
+                for quarter, sec_left, outcome, is_missing, weight in
+                zip(quarters, sec_lefts, outcomes, missing, weights)}
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class OutcomeIndexWriter:
+    """A class for writing an outcome index one game at a time
+
+    Arrays go straight into the compressed .npz as every game is added, so
+    memory only holds the game being written.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.games = []
+        # Written next to the final place and renamed, so concurrent builders never see half an index
+        fd, self._partial_path = tempfile.mkstemp(dir=os.path.dirname(index_path) or '.', prefix='.partial-')
+        os.close(fd)
+        self._zip = zipfile.ZipFile(self._partial_path, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def _write_array(self, key, array):
+        with self._zip.open(key + '.npy', 'w', force_zip64=True) as file:
+            np.lib.format.write_array(file, np.asanyarray(array), allow_pickle=False)
+
+    def add(self, game, rows):
+        """Adds a game from its rows grouped by group_game, every game can only be added once"""
+        if game in self.games:
+            raise ValueError(f'Game {game} was already added to {self.index_path}')
+        self.games.append(game)
+        outcomes = rows['Outcome']
+        self._write_array(game + '_quarter', rows['Quarter'].to_numpy(np.int64))
+        self._write_array(game + '_sec_left', rows['SecLeft'].to_numpy(np.int64))
+        self._write_array(game + '_outcome', np.array(outcomes.fillna('').tolist(), dtype=str))
+        self._write_array(game + '_outcome_missing', outcomes.isna().to_numpy())
+        self._write_array(game + '_weight', rows['Weight'].to_numpy(np.int64))
+
+    def close(self):
+        self._write_array('games', np.array(self.games, dtype=str))
+        self._zip.close()
+        # mkstemp creates the file readable by its owner only, give it the mode of any other output
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(self._partial_path, 0o666 & ~umask)
+        os.replace(self._partial_path, self.index_path)
+
+    def abort(self):
+        self._zip.close()
+        os.remove(self._partial_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,124 @@
+import numpy as np
+
+from Trajectory import Trajectory
+
+
+def format_players_by_team(player_ids_dict, team_ids, player_ids, positions, team_id):
+    return {
+        player_ids_dict[player_id][0]: {"id": player_id, "x": position[0], "y": position[1]}
+        for entity_team_id, player_id, position in zip(team_ids, player_ids, positions)
+        if entity_team_id == team_id
+    }
+
+
+def build_snapshots(trajectory, player_ids_dict, home_team_id, guest_team_id):
+    """Returns the snapshot dict of every frame, the json form of a trajectory"""
+    positions = trajectory.positions.tolist()
+    team_ids = trajectory.team_ids.tolist()
+    player_ids = trajectory.player_ids.tolist()
+    game_clocks = trajectory.game_clock.tolist()
+    quarters = trajectory.quarter.tolist()
+    shot_clocks = [None if shot_clock != shot_clock else shot_clock for shot_clock in trajectory.shot_clock.tolist()]
+
+    time_snapshots = []
+    for idx in range(len(trajectory)):
+        ball = positions[idx][0]
+        moment_data = {
+            "Ball": {"x": ball[0], "y": ball[1], "radius": ball[2]},
+            "HomePlayers": format_players_by_team(player_ids_dict, team_ids[idx], player_ids[idx],
+                                                  positions[idx], home_team_id),
+            "GuestPlayers": format_players_by_team(player_ids_dict, team_ids[idx], player_ids[idx],
+                                                   positions[idx], guest_team_id),
+            "GameClock": game_clocks[idx],
+            "Quarter": quarters[idx],
+            "ShotClock": shot_clocks[idx]
+        }
+        time_snapshots.append(moment_data)
+    return time_snapshots
+
+
+class PassStore:
+    """A class for keeping the passes of a game as a table over the game's trajectory
+
+    Passes only hold a [start, stop) frame range into the trajectory, and
+    player names are stored once per game. Saved as a compressed .npz, so
+    loading is an array read with no parsing, and snapshot dicts are only
+    built for the passes a caller materializes.
+    """
+
+    def __init__(self, trajectory, passes, player_ids_dict, home_team_id, guest_team_id):
+        self.trajectory = trajectory
+        self.passes = passes  # dicts with pass_from, pass_to, frames, GameClock, Quarter, ...
+        self.player_ids_dict = player_ids_dict
+        self.home_team_id = home_team_id
+        self.guest_team_id = guest_team_id
+
+    def save(self, path):
+        player_ids = list(self.player_ids_dict)
+        player_names = [self.player_ids_dict[player_id][0] for player_id in player_ids]
+        name_index = {}
+        for index, name in enumerate(player_names):
+            name_index.setdefault(name, index)
+        passes = self.passes
+        shot_clocks = [one_pass["ShotClock"] for one_pass in passes]
+        with open(path, 'wb') as file:
+            np.savez_compressed(
+                file,
+                **{'trajectory_' + column: getattr(self.trajectory, column) for column in Trajectory.COLUMNS},
+                team_ids=np.array([self.home_team_id, self.guest_team_id], dtype=np.int64),
+                player_ids=np.array(player_ids, dtype=np.int64),
+                player_names=np.array(player_names, dtype=str),
+                player_jerseys=np.array([self.player_ids_dict[player_id][1] for player_id in player_ids], dtype=str),
+                # -1 stands for no player
+                pass_from=np.array([name_index.get(one_pass["pass_from"], -1) for one_pass in passes], dtype=np.int64),
+                pass_to=np.array([name_index.get(one_pass["pass_to"], -1) for one_pass in passes], dtype=np.int64),
+                pass_frames=np.array([one_pass["frames"] for one_pass in passes], dtype=np.int64).reshape(-1, 2),
+                pass_game_clock=np.array([one_pass["GameClock"] for one_pass in passes], dtype=np.float64),
+                pass_quarter=np.array([one_pass["Quarter"] for one_pass in passes], dtype=np.int8),
+                pass_shot_clock=np.array(shot_clocks, dtype=np.float64),
+                pass_distance=np.array([one_pass["distance"] for one_pass in passes], dtype=np.float64),
+                pass_duration=np.array([one_pass["pass_duration"] for one_pass in passes], dtype=np.float64))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            trajectory = Trajectory(*(data['trajectory_' + column] for column in Trajectory.COLUMNS))
+            home_team_id, guest_team_id = data['team_ids'].tolist()
+            player_ids_dict = dict(zip(data['player_ids'].tolist(),
+                                       zip(data['player_names'].tolist(), data['player_jerseys'].tolist())))
+            player_names = data['player_names'].tolist() + [None]
+            columns = zip(data['pass_from'].tolist(), data['pass_to'].tolist(), data['pass_frames'].tolist(),
+                          data['pass_game_clock'].tolist(), data['pass_quarter'].tolist(),
+                          data['pass_shot_clock'].tolist(), data['pass_distance'].tolist(),
+                          data['pass_duration'].tolist())
+        passes = [{
+            "pass_from": player_names[pass_from],
+            "pass_to": player_names[pass_to],
+            "frames": frames,
+            "GameClock": game_clock,
+            "Quarter": quarter,
+            "ShotClock": None if shot_clock != shot_clock else shot_clock,
+            "distance": distance,
+            "pass_duration": pass_duration
+        } for pass_from, pass_to, frames, game_clock, quarter, shot_clock, distance, pass_duration in columns]
+        return cls(trajectory, passes, player_ids_dict, home_team_id, guest_team_id)
+
+    def snapshots(self, start, stop):
+        return build_snapshots(self.trajectory[start:stop], self.player_ids_dict, self.home_team_id,
+                               self.guest_team_id)
+
+    def materialize(self, one_pass):
+        """Returns the pass in its json form, with snapshot dicts instead of a frame range"""
+        return {
+            "pass_from": one_pass["pass_from"],
+            "pass_to": one_pass["pass_to"],
+            "snapshots": self.snapshots(*one_pass["frames"]),
+            "GameClock": one_pass["GameClock"],
+            "Quarter": one_pass["Quarter"],
+            "ShotClock": one_pass["ShotClock"],
+            "distance": one_pass["distance"],
+            "pass_duration": one_pass["pass_duration"]
+        }
+
+    def to_json(self):
+        return [self.materialize(one_pass) for one_pass in self.passes]
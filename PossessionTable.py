@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from collections.abc import Mapping
+
+import numpy as np
+
+# Keys of a possession holding node-link graphs, a single graph or a list of them
+GRAPH_KEYS = ('attacking_graph', 'defensive_graphs')
+GRAPH_ARRAYS = ('possession_offsets', 'node_offsets', 'nodes', 'edge_offsets', 'sources', 'targets', 'weights',
+                'directed', 'multigraph')
+
+
+def source_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def flatten_graphs(values):
+    """Packs the node-link graphs of every possession into flat arrays, returns them and the node names
+
+    The graphs of possession p are possession_offsets[p] to
+    possession_offsets[p + 1], and the nodes and edges of graph g are the
+    node_offsets and edge_offsets ranges of g. Nodes are indices into the
+    names. Only node ids and edge weights are kept, which is all
+    create_graphs.ipynb writes.
+    """
+    names = {}
+    arrays = {name: [] for name in GRAPH_ARRAYS}
+    for name in ('possession_offsets', 'node_offsets', 'edge_offsets'):
+        arrays[name].append(0)
+    for value in values:
+        graphs = [] if value is None else [value] if isinstance(value, dict) else value
+        for data in graphs:
+            local = {}
+            for node in data['nodes']:
+                local[node['id']] = len(local)
+                arrays['nodes'].append(names.setdefault(node['id'], len(names)))
+            # Written as 'links' before networkx 3.4
+            for link in data.get('links', data.get('edges', [])):
+                arrays['sources'].append(local[link['source']])
+                arrays['targets'].append(local[link['target']])
+                arrays['weights'].append(link.get('weight', np.nan))
+            arrays['node_offsets'].append(len(arrays['nodes']))
+            arrays['edge_offsets'].append(len(arrays['sources']))
+            arrays['directed'].append(data.get('directed', False))
+            arrays['multigraph'].append(data.get('multigraph', False))
+        arrays['possession_offsets'].append(len(arrays['directed']))
+    integral = all(type(weight) is int for weight in arrays['weights'])
+    arrays = {name: np.array(values, dtype=np.float64 if name == 'weights' else bool
+                             if name in ('directed', 'multigraph') else np.int64)
+              for name, values in arrays.items()}
+    if integral:
+        arrays['weights'] = arrays['weights'].astype(np.int64)
+    return arrays, list(names)
+
+
+class Possession(Mapping):
+    """A row of a PossessionTable, read like a possession dict of the json
+
+    Graphs are rebuilt as networkx graphs the first time they are looked up.
+    """
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+        self._graphs = {}
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key in GRAPH_KEYS:
+            if key not in self._graphs:
+                self._graphs[key] = self._table.graphs(key, self._index)
+            return self._graphs[key]
+        return self._table.values(key)[self._index]
+
+    def __contains__(self, key):
+        return key in self._table.columns and self._table.present(key)[self._index]
+
+    def __iter__(self):
+        return (key for key in self._table.columns if key in self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class PossessionTable:
+    """A class for reading data/possessions_for_jonathan.json once into a column-oriented table
+
+    Every key of the possessions is a column: numbers are stored as arrays,
+    everything else as a pickled list, each read from disk the first time it
+    is used. The node-link graphs are stored as flat node and edge arrays.
+    The table is cached in cache_dir and rebuilt when the json changes, and
+    loading the same json again in a process returns the same table.
+    """
+    # Bump whenever the layout of an entry changes, so that stale entries are never read
+    FORMAT_VERSION = 1
+    DEFAULT_PATH = './data/possessions_for_jonathan.json'
+    DEFAULT_CACHE_DIR = './data/cache/possessions'
+    _loaded = {}
+
+    def __init__(self, entry_path):
+        self.entry_path = entry_path
+        with open(os.path.join(entry_path, 'table.json')) as file:
+            table = json.load(file)
+        self.source = table['source']
+        self.length = table['length']
+        self.columns = {name: kind for name, kind in table['columns']}
+        self._files = {name: f'c{i}' for i, (name, _) in enumerate(table['columns'])}
+        self._names = table['names']
+        with np.load(os.path.join(entry_path, 'present.npz')) as present:
+            self._present = {name: present[file] for name, file in self._files.items()}
+        self._arrays = {}
+        self._values = {}
+        self._rows = None
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH, cache_dir=DEFAULT_CACHE_DIR):
+        """Returns the table of the possessions json at path, building and caching it when it changed"""
+        source = os.path.abspath(path)
+        stamp = source_stamp(path)
+        table = cls._loaded.get(source)
+        if table is not None and table.source == stamp:
+            return table
+        name = os.path.basename(source).rsplit('.', 1)[0]
+        entry_path = os.path.join(cache_dir, f"{name}-{hashlib.sha256(source.encode()).hexdigest()[:16]}"
+                                             f"-v{cls.FORMAT_VERSION}")
+        table_path = os.path.join(entry_path, 'table.json')
+        cached = False
+        if os.path.exists(table_path):
+            with open(table_path) as file:
+                cached = json.load(file)['source'] == stamp
+        if not cached:
+            cls._write(path, stamp, cache_dir, entry_path)
+        table = cls._loaded[source] = cls(entry_path)
+        return table
+
+    @classmethod
+    def _write(cls, path, stamp, cache_dir, entry_path):
+        with open(path) as file:
+            possessions = json.load(file)
+        columns = {}
+        for possession in possessions:
+            for key in possession:
+                columns.setdefault(key, None)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write next to the final place and rename, so readers never see half an entry
+        partial_path = tempfile.mkdtemp(dir=cache_dir, prefix='.partial-')
+        try:
+            present = {}
+            for i, key in enumerate(columns):
+                file = os.path.join(partial_path, f'c{i}')
+                present[f'c{i}'] = np.array([key in possession for possession in possessions])
+                values = [possession.get(key) for possession in possessions]
+                kinds = {type(value) for value, has in zip(values, present[f'c{i}']) if has}
+                if key in GRAPH_KEYS:
+                    arrays, names = flatten_graphs(values)
+                    np.savez(file + '.npz', **arrays)
+                    # 'graph' for a single graph per possession, 'graphs' for a list of them
+                    columns[key] = ('graph' if kinds <= {dict} else 'graphs', names)
+                elif kinds <= {int} or kinds <= {float}:
+                    kind = 'int64' if kinds <= {int} else 'float64'
+                    np.save(file + '.npy', np.array([value if value is not None else 0 for value in values],
+                                                    dtype=kind))
+                    columns[key] = (kind, None)
+                else:
+                    with open(file + '.pkl', 'wb') as output:
+                        pickle.dump(values, output, protocol=pickle.HIGHEST_PROTOCOL)
+                    columns[key] = ('object', None)
+            np.savez(os.path.join(partial_path, 'present.npz'), **present)
+            graph_names = {key: names for key, (_, names) in columns.items() if names is not None}
+            with open(os.path.join(partial_path, 'table.json'), 'w') as file:
+                json.dump({
+                    'source': stamp,
+                    'length': len(possessions),
+                    'columns': [[key, kind] for key, (kind, _) in columns.items()],
+                    'names': graph_names,
+                }, file)
+            shutil.rmtree(entry_path, ignore_errors=True)
+            os.rename(partial_path, entry_path)
+        except OSError:
+            shutil.rmtree(partial_path, ignore_errors=True)
+            if not os.path.isdir(entry_path):
+                raise
+
+    def present(self, name):
+        """Whether every possession has the key name"""
+        return self._present[name]
+
+    def column(self, name):
+        """The values of a column, an array for numbers and a list otherwise, with None where a possession
+        does not have the key (0 in arrays)
+
+        Graph columns are returned as the dict of their flat arrays.
+        """
+        if name not in self._arrays:
+            kind = self.columns[name]
+            file = os.path.join(self.entry_path, self._files[name])
+            if kind in ('graph', 'graphs'):
+                with np.load(file + '.npz') as arrays:
+                    self._arrays[name] = {array: arrays[array] for array in GRAPH_ARRAYS}
+            elif kind == 'object':
+                with open(file + '.pkl', 'rb') as values:
+                    self._arrays[name] = pickle.load(values)
+            else:
+                self._arrays[name] = np.load(file + '.npy')
+        return self._arrays[name]
+
+    def values(self, name):
+        """The values of a column as a list of Python objects, None where a possession does not have the key"""
+        if name not in self._values:
+            values = self.column(name)
+            if self.columns[name] in ('int64', 'float64'):
+                values = [value if has else None for value, has in zip(values.tolist(), self.present(name))]
+            self._values[name] = values
+        return self._values[name]
+
+    def graphs(self, name, index):
+        """Rebuilds the networkx graph, or the list of graphs, of the graph column name of a possession"""
+        import networkx as nx
+
+        if name not in self._values:
+            self._values[name] = {array: values.tolist() for array, values in self.column(name).items()}
+        arrays = self._values[name]
+        names = self._names[name]
+        graphs = []
+        for graph in range(arrays['possession_offsets'][index], arrays['possession_offsets'][index + 1]):
+            if arrays['multigraph'][graph]:
+                G = nx.MultiDiGraph() if arrays['directed'][graph] else nx.MultiGraph()
+            else:
+                G = nx.DiGraph() if arrays['directed'][graph] else nx.Graph()
+            nodes = [names[node] for node in
+                     arrays['nodes'][arrays['node_offsets'][graph]:arrays['node_offsets'][graph + 1]]]
+            G.add_nodes_from(nodes)
+            edges = slice(arrays['edge_offsets'][graph], arrays['edge_offsets'][graph + 1])
+            for source, target, weight in zip(arrays['sources'][edges], arrays['targets'][edges],
+                                              arrays['weights'][edges]):
+                if weight == weight:
+                    G.add_edge(nodes[source], nodes[target], weight=weight)
+                else:
+                    G.add_edge(nodes[source], nodes[target])
+            graphs.append(G)
+        return graphs[0] if self.columns[name] == 'graph' else graphs
+
+    def rows(self):
+        if self._rows is None:
+            self._rows = [Possession(self, index) for index in range(self.length)]
+        return self._rows
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def __getitem__(self, key):
+        """The possession at an index, or the column of a key"""
+        if isinstance(key, str):
+            return self.column(key)
+        return self.rows()[key]
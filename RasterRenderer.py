@@ -0,0 +1,131 @@
+import numpy as np
+
+from Constant import Constant
+from Event import COURT_PATH
+from Team import Team
+from Trajectory import Trajectory
+
+BALL_COLOR = (0xff, 0x8c, 0x00)  # The orange of Ball.color
+
+
+def hex_to_rgb(color):
+    return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+
+class RasterRenderer:
+    """A class for rendering event frames straight into a NumPy frame buffer, without matplotlib
+
+    The court is scaled into a background buffer once. Every frame copies it
+    and stamps precomputed anti-aliased disc and glyph masks for the players,
+    the ball, the jersey numbers and the clock, at scale pixels per foot.
+    Glyphs are rasterized once with Pillow's default font.
+    """
+
+    def __init__(self, scale=10, court_path=COURT_PATH, font_size=None):
+        from PIL import Image, ImageFont
+
+        self.scale = scale
+        self.width = int(round((Constant.X_MAX - Constant.X_MIN) * scale))
+        self.height = int(round((Constant.Y_MAX - Constant.Y_MIN) * scale))
+        self.background = np.full((self.height, self.width, 4), 255, dtype=np.uint8)
+        court_width = int(round((Constant.X_MAX - Constant.DIFF - Constant.X_MIN) * scale))
+        with Image.open(court_path) as court:
+            court = court.convert('RGBA').resize((court_width, self.height), Image.BILINEAR)
+        # Flipped like Event's imshow, which puts the first row of the image at y = 0
+        self.background[:, :court_width] = np.flipud(np.asarray(court))
+        self._font = ImageFont.load_default(font_size or 1.4 * scale)
+        self._glyphs = {}
+        self._discs = {}
+        self._labels = {}
+
+    def to_pixels(self, x, y):
+        """Column and row of court coordinates, y grows upwards on the court and downwards in the frame"""
+        return (x - Constant.X_MIN) * self.scale, (Constant.Y_MAX - y) * self.scale
+
+    def _disc(self, radius):
+        """Alpha mask of a disc of radius pixels, anti-aliased over one pixel at its edge"""
+        radius = round(radius * 4) / 4
+        if radius not in self._discs:
+            half = int(np.ceil(radius))
+            offsets = np.arange(-half, half + 1, dtype=np.float32)
+            distances = np.sqrt(offsets[:, None] ** 2 + offsets[None, :] ** 2)
+            self._discs[radius] = np.clip(radius + 0.5 - distances, 0, 1)
+        return self._discs[radius]
+
+    def _glyph(self, char):
+        if char not in self._glyphs:
+            from PIL import Image, ImageDraw
+
+            ascent, descent = self._font.getmetrics()
+            image = Image.new('L', (max(1, int(np.ceil(self._font.getlength(char)))), ascent + descent))
+            ImageDraw.Draw(image).text((0, 0), char, font=self._font, fill=255)
+            self._glyphs[char] = np.asarray(image, dtype=np.float32) / 255
+        return self._glyphs[char]
+
+    def text(self, text, bold=False):
+        """Alpha mask of text, lines centered under each other"""
+        lines = [np.concatenate([self._glyph(char) for char in line], axis=1) if line else self._glyph(' ')
+                 for line in text.split('\n')]
+        width = max(line.shape[1] for line in lines)
+        mask = np.concatenate([np.pad(line, ((0, 0), ((width - line.shape[1]) // 2,
+                                                      (width - line.shape[1] + 1) // 2))) for line in lines])
+        if bold:
+            # One pixel wider strokes
+            mask = np.pad(mask, ((0, 0), (0, 1)))
+            mask[:, 1:] = np.maximum(mask[:, 1:], mask[:, :-1])
+        return mask
+
+    def stamp(self, frame, mask, column, row, color):
+        """Blends color into the uint8 frame through mask, centered on (column, row) and clipped to the frame"""
+        height, width = mask.shape
+        top = int(round(row)) - height // 2
+        left = int(round(column)) - width // 2
+        frame_top, frame_left = max(top, 0), max(left, 0)
+        frame_bottom, frame_right = min(top + height, frame.shape[0]), min(left + width, frame.shape[1])
+        if frame_top >= frame_bottom or frame_left >= frame_right:
+            return
+        alpha = mask[frame_top - top:frame_bottom - top, frame_left - left:frame_right - left, None]
+        region = frame[frame_top:frame_bottom, frame_left:frame_right, :3]
+        blended = region + alpha * (np.asarray(color, dtype=np.float32) - region)
+        region[...] = blended + 0.5
+
+    def frames(self, trajectory, player_ids_dict, clock_texts):
+        """Yields every frame of trajectory as a (height, width, 4) uint8 RGBA array
+
+        The same buffer is reused for every frame, consume a frame before
+        asking for the next one.
+        """
+        columns, rows = self.to_pixels(trajectory.positions[:, :, 0], trajectory.positions[:, :, 1])
+        visible = np.isfinite(columns) & np.isfinite(rows) & (trajectory.team_ids != 0)
+        ball_radii = trajectory.ball[:, 2] / Constant.NORMALIZATION_COEF * self.scale
+        team_colors = {team_id: hex_to_rgb(color) for team_id, (color, _) in Team.color_dict.items()}
+        player_radius = Constant.PLAYER_CIRCLE_SIZE * self.scale
+        player_disc = self._disc(player_radius)
+        clock_column, clock_row = self.to_pixels(Constant.X_CENTER, Constant.Y_CENTER)
+        columns, rows, visible = columns.tolist(), rows.tolist(), visible.tolist()
+        team_ids, player_ids = trajectory.team_ids.tolist(), trajectory.player_ids.tolist()
+
+        frame = np.empty_like(self.background)
+        for i in range(len(trajectory)):
+            np.copyto(frame, self.background)
+            players = [j for j in range(1, Trajectory.ENTITIES) if visible[i][j]]
+            for j in players:
+                self.stamp(frame, player_disc, columns[i][j], rows[i][j], team_colors.get(team_ids[i][j], (0, 0, 0)))
+            if visible[i][0] and ball_radii[i] > 0:
+                self.stamp(frame, self._disc(ball_radii[i]), columns[i][0], rows[i][0], BALL_COLOR)
+            for j in players:
+                player_id = player_ids[i][j]
+                if player_id not in self._labels:
+                    jersey = player_ids_dict[player_id][1] if player_id in player_ids_dict else ''
+                    self._labels[player_id] = self.text(jersey, bold=True)
+                self.stamp(frame, self._labels[player_id], columns[i][j], rows[i][j], (255, 255, 255))
+            self.stamp(frame, self.text(clock_texts[i]), clock_column, clock_row, (0, 0, 0))
+            yield frame
+
+    def save(self, trajectory, player_ids_dict, clock_texts, path, fps):
+        from FrameWriter import FrameWriter
+
+        with FrameWriter(path, self.width, self.height, fps) as writer:
+            for frame in self.frames(trajectory, player_ids_dict, clock_texts):
+                writer.write(frame)
+        return path
@@ -0,0 +1,132 @@
+import queue
+import threading
+
+from py7zr import SevenZipFile
+from py7zr.io import Py7zIO, WriterFactory
+
+
+class _StreamClosed(Exception):
+    pass
+
+
+class _QueueWriter(Py7zIO):
+    """Hands every decompressed block over to the reading side of the stream"""
+
+    def __init__(self, chunks, closing):
+        self._chunks = chunks
+        self._closing = closing
+        self._size = 0
+
+    def write(self, s):
+        while True:
+            if self._closing.is_set():
+                raise _StreamClosed()
+            try:
+                self._chunks.put(bytes(s), timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self._size += len(s)
+        return len(s)
+
+    def read(self, size=None):
+        return b''
+
+    def seek(self, offset, whence=0):
+        return self._size
+
+    def seekable(self):
+        return False
+
+    def flush(self):
+        pass
+
+    def size(self):
+        return self._size
+
+
+class _QueueWriterFactory(WriterFactory):
+
+    def __init__(self, chunks, closing):
+        self._chunks = chunks
+        self._closing = closing
+
+    def create(self, filename):
+        return _QueueWriter(self._chunks, self._closing)
+
+
+class SevenZipStream:
+    """A class for reading a member of a .7z archive while it is being decompressed
+
+    Decompression runs in a background thread and at most MAX_CHUNKS blocks
+    are held in memory, so nothing is written to disk and memory stays
+    bounded whatever the size of the member. The stream is not seekable.
+    """
+    MAX_CHUNKS = 64
+
+    def __init__(self, path, member=None):
+        self._archive = SevenZipFile(path, mode='r')
+        self.name = member if member is not None else self._archive.getnames()[0]
+        self._chunks = queue.Queue(maxsize=self.MAX_CHUNKS)
+        self._closing = threading.Event()
+        self._buffer = b''
+        self._finished = False
+        self._thread = threading.Thread(target=self._extract, daemon=True)
+        self._thread.start()
+
+    def _extract(self):
+        try:
+            self._archive.extract(targets=[self.name], factory=_QueueWriterFactory(self._chunks, self._closing))
+            result = None
+        except Exception as e:
+            result = e
+        finally:
+            self._archive.close()
+        # The end of the member is only signalled once py7zr has checked its CRC
+        while not self._closing.is_set():
+            try:
+                self._chunks.put(result, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+    def read(self, size=-1):
+        pieces = [self._buffer]
+        buffered = len(self._buffer)
+        while not self._finished and (size is None or size < 0 or buffered < size):
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._finished = True
+            elif isinstance(chunk, Exception):
+                self._finished = True
+                if not isinstance(chunk, _StreamClosed):
+                    raise chunk
+            else:
+                pieces.append(chunk)
+                buffered += len(chunk)
+        self._buffer = b''.join(pieces)
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        self._closing.set()
+        # Unblock the decompression thread if it is waiting on a full queue
+        while self._thread.is_alive():
+            try:
+                self._chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
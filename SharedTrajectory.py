@@ -0,0 +1,56 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from Trajectory import Trajectory
+
+
+class SharedTrajectory:
+    """A class for sharing one copy of a trajectory's arrays between processes
+
+    All columns live in a single shared memory block. Worker processes attach
+    to it through spec, a small picklable description of the block, and get
+    a read-only Trajectory over it without copying the arrays.
+    """
+    ALIGNMENT = 64
+
+    def __init__(self, trajectory):
+        layout = []
+        size = 0
+        for column in Trajectory.COLUMNS:
+            array = getattr(trajectory, column)
+            layout.append((column, array.shape, array.dtype.str, size))
+            size += -(-array.nbytes // self.ALIGNMENT) * self.ALIGNMENT
+        self._memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for column, shape, dtype, offset in layout:
+            np.ndarray(shape, dtype=dtype, buffer=self._memory.buf, offset=offset)[...] = getattr(trajectory, column)
+        self.spec = (self._memory.name, tuple(layout))
+        self.trajectory = self._view(self._memory, layout)
+
+    @staticmethod
+    def _view(memory, layout):
+        arrays = []
+        for column, shape, dtype, offset in layout:
+            array = np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset)
+            array.flags.writeable = False
+            arrays.append(array)
+        return Trajectory(*arrays)
+
+    @classmethod
+    def attach(cls, spec):
+        """Returns the shared memory block of spec and a Trajectory over it, keep the block alive while in use"""
+        name, layout = spec
+        memory = shared_memory.SharedMemory(name=name)
+        return memory, cls._view(memory, layout)
+
+    def close(self):
+        # The views have to go before the block can be closed
+        self.trajectory = None
+        self._memory.close()
+        self._memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
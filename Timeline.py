@@ -0,0 +1,45 @@
+import numpy as np
+
+from Trajectory import Trajectory
+
+
+class Timeline:
+    """A class for merging the events of a game into one deduplicated frame sequence
+
+    SportVU events overlap and often repeat each other's moments. The timeline
+    keeps every frame once, ordered by quarter and game clock (the timestamp
+    breaks ties while the clock is stopped), and remembers which events each
+    frame came from.
+    """
+
+    def __init__(self, trajectory, event_ids, source_event_ids, source_frames):
+        self.trajectory = trajectory
+        self.event_ids = event_ids  # (frames,) first event each frame was seen in
+        self._source_event_ids = source_event_ids  # (event frames,) event of every frame before deduplication
+        self._source_frames = source_frames  # (event frames,) timeline frame of every frame before deduplication
+
+    @classmethod
+    def from_trajectories(cls, trajectories, event_ids):
+        merged = Trajectory.concatenate(trajectories)
+        source_event_ids = np.repeat(np.asarray(event_ids, dtype=np.int64),
+                                     [len(trajectory) for trajectory in trajectories])
+        # lexsort is stable, so among duplicates the frame of the earliest event comes first
+        order = np.lexsort((merged.timestamp, -merged.game_clock, merged.quarter))
+        quarter = merged.quarter[order]
+        game_clock = merged.game_clock[order]
+        timestamp = merged.timestamp[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (quarter[1:] != quarter[:-1]) | (game_clock[1:] != game_clock[:-1]) | \
+                    (timestamp[1:] != timestamp[:-1])
+
+        source_frames = np.empty(len(order), dtype=np.int64)
+        source_frames[order] = np.cumsum(first) - 1
+        kept = order[first]
+        return cls(merged.take(kept), source_event_ids[kept], source_event_ids, source_frames)
+
+    def frames_of(self, event_id):
+        """Returns the timeline frame indices that event_id covers"""
+        return np.unique(self._source_frames[self._source_event_ids == event_id])
+
+    def __len__(self):
+        return len(self.trajectory)
@@ -0,0 +1,93 @@
+import numpy as np
+
+from Moment import Moment
+
+
+class Trajectory:
+    """A class for keeping the moments of an event as columnar arrays
+
+    Entity 0 is the ball, entities 1 to 10 are the players, in the order they
+    appear in the json. Missing players are padded with NaN positions and id 0.
+    """
+    ENTITIES = 11
+    COLUMNS = ('quarter', 'timestamp', 'game_clock', 'shot_clock', 'positions', 'team_ids', 'player_ids')
+
+    def __init__(self, quarter, timestamp, game_clock, shot_clock, positions, team_ids, player_ids):
+        self.quarter = quarter  # (frames,)
+        self.timestamp = timestamp  # (frames,) milliseconds since epoch
+        self.game_clock = game_clock  # (frames,)
+        self.shot_clock = shot_clock  # (frames,) NaN when the shot clock is off
+        self.positions = positions  # (frames, entities, 3) x, y, z (radius for the ball)
+        self.team_ids = team_ids  # (frames, entities)
+        self.player_ids = player_ids  # (frames, entities)
+
+    @classmethod
+    def from_moments(cls, moments):
+        frames = len(moments)
+        # Hardcoded positions for quarter, timestamp, game_clock, shot_clock and entities in json
+        quarter = np.array([moment[0] for moment in moments], dtype=np.int8)
+        timestamp = np.array([moment[1] for moment in moments], dtype=np.int64)
+        game_clock = np.array([moment[2] for moment in moments], dtype=np.float64)
+        shot_clock = np.array([moment[3] for moment in moments], dtype=np.float64)
+
+        counts = np.array([min(len(moment[5]), cls.ENTITIES) for moment in moments], dtype=np.intp)
+        rows = np.array([entity for moment in moments for entity in moment[5][:cls.ENTITIES]],
+                        dtype=np.float64).reshape(-1, 5)
+        positions = np.full((frames, cls.ENTITIES, 3), np.nan)
+        team_ids = np.zeros((frames, cls.ENTITIES), dtype=np.int64)
+        player_ids = np.zeros((frames, cls.ENTITIES), dtype=np.int64)
+        if frames and (counts == cls.ENTITIES).all():
+            rows = rows.reshape(frames, cls.ENTITIES, 5)
+            positions[:] = rows[:, :, 2:]
+            team_ids[:] = rows[:, :, 0]
+            player_ids[:] = rows[:, :, 1]
+        elif len(rows):
+            # Ragged frames: scatter every entity row into its (frame, slot) cell
+            frame_index = np.repeat(np.arange(frames), counts)
+            slot_index = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+            positions[frame_index, slot_index] = rows[:, 2:]
+            team_ids[frame_index, slot_index] = rows[:, 0]
+            player_ids[frame_index, slot_index] = rows[:, 1]
+        return cls(quarter, timestamp, game_clock, shot_clock, positions, team_ids, player_ids)
+
+    @classmethod
+    def concatenate(cls, trajectories):
+        if not trajectories:
+            return cls.from_moments([])
+        return cls(*(np.concatenate([getattr(trajectory, column) for trajectory in trajectories])
+                     for column in cls.COLUMNS))
+
+    def take(self, indices):
+        return Trajectory(*(getattr(self, column)[indices] for column in self.COLUMNS))
+
+    @property
+    def ball(self):
+        return self.positions[:, 0]
+
+    @property
+    def players(self):
+        return self.positions[:, 1:]
+
+    def moment(self, index):
+        """Builds a Moment for a single frame, for callers that need the object view"""
+        present = self.team_ids[index] != 0
+        entities = np.column_stack((self.team_ids[index], self.player_ids[index], self.positions[index]))[present]
+        shot_clock = self.shot_clock[index]
+        return Moment([int(self.quarter[index]), int(self.timestamp[index]), float(self.game_clock[index]),
+                       None if np.isnan(shot_clock) else float(shot_clock), None,
+                       [[int(row[0]), int(row[1]), *row[2:]] for row in entities.tolist()]])
+
+    def __len__(self):
+        return len(self.game_clock)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('moment index out of range')
+        return self.moment(index)
+
+    def __iter__(self):
+        return (self.moment(index) for index in range(len(self)))
@@ -1,33 +1,165 @@
-import subprocess
-import multiprocessing as mp
-from glob import glob
-import random
+import argparse
+import json
 import os
+import random
+import tempfile
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from glob import glob
 
-random.seed(0)
+import get_play_data
+from GameCache import GameCache
+from OutcomeIndex import OutcomeIndex
+from get_passing_data import extract_passing, str2bool
+from get_play_data import build_plays, espn_csv_path
 
-filenames = glob("data/2016.NBA.Raw.SportVU.Game.Logs/*.7z")
-filenames = [filename for filename in filenames if not filename.startswith('2016')]
+STAGES = ('passing', 'plays')
 
-# Randomly choose 30 files from the list
-filenames = random.sample(filenames, 30)
 
-def run_command(game_name):
-    subprocess.run(["python", "get_play_data.py", "--game_name", game_name])
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as file:
+        return json.load(file)
 
-if __name__ == '__main__':
 
-    game_names_to_run = []
+def save_manifest(manifest, manifest_path):
+    # Write next to the manifest and rename, an interrupted run never leaves half a manifest
+    fd, partial_path = tempfile.mkstemp(dir=os.path.dirname(manifest_path) or '.', prefix='.manifest-')
+    with os.fdopen(fd, 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    # mkstemp creates the file readable by its owner only, give it the mode of any other output
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(partial_path, 0o666 & ~umask)
+    os.replace(partial_path, manifest_path)
+
+
+def stage_outputs(game_name, output_all_folder, output_filtered_folder):
+    return {
+        'passing': [os.path.join(get_play_data.output_folder, game_name + '.npz')],
+        'plays': [os.path.join(output_all_folder, game_name + '.json'),
+                  os.path.join(output_filtered_folder, game_name + '.json')],
+    }
+
+
+def pending_stages(game_record, outputs):
+    """Stages that are not done yet, a done stage whose output has gone missing is redone
+
+    A stage the manifest has no record of, e.g. built before there was a
+    manifest or after it was deleted, is done when all of its outputs exist.
+    """
+    return [stage for stage in STAGES
+            if game_record.get(stage, {'status': 'done'}).get('status') != 'done'
+            or not all(os.path.exists(path) for path in outputs[stage])]
+
 
+def run_game(job):
+    """Runs the pending stages of one game in a worker process, returns their manifest records"""
+    game_name, archive_path, stages, options = job
+    records = {}
+    for stage in stages:
+        start = time.time()
+        try:
+            if stage == 'passing':
+                extract_passing(archive_path, output_dir=get_play_data.output_folder, cache=options['cache'],
+                                cache_dir=options['cache_dir'])
+            else:
+                build_plays(game_name, options['output_all_folder'], options['output_filtered_folder'])
+        except Exception as e:
+            records[stage] = {'status': 'failed', 'seconds': round(time.time() - start, 3),
+                              'error': f"{type(e).__name__}: {e}", 'traceback': traceback.format_exc()}
+            # Later stages need this one
+            break
+        records[stage] = {'status': 'done', 'seconds': round(time.time() - start, 3)}
+    return game_name, records
+
+
+def run_games(jobs, workers, run=run_game):
+    """Runs the jobs in a process pool, yields (game name, manifest records) as games finish
+
+    Jobs are handed out in order, at most workers at a time. A worker that
+    dies, e.g. killed by the OOM killer, breaks the pool: the games in flight
+    then are reported failed and the remaining games go on in a new pool.
+    """
+    pending = list(reversed(jobs))
+    while pending:
+        in_flight = {}
+        with ProcessPoolExecutor(workers) as executor:
+            try:
+                while pending or in_flight:
+                    while pending and len(in_flight) < workers:
+                        job = pending.pop()
+                        in_flight[executor.submit(run, job)] = job, time.time()
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        del in_flight[future]
+                        yield result
+            except BrokenProcessPool as e:
+                error = f"{type(e).__name__}: a worker died while this game was running, e.g. out of memory"
+                for future, ((game_name, _, stages, _), start) in in_flight.items():
+                    if future.done() and future.exception() is None:
+                        yield future.result()
+                    else:
+                        yield game_name, {stages[0]: {'status': 'failed', 'seconds': round(time.time() - start, 3),
+                                                      'error': error}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the plays of every game in the archive directory.')
+    parser.add_argument('--data_dir', type=str, default=get_play_data.original_data_folder,
+                        help='Folder with the SportVU .7z archives')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--sample', type=int, default=None,
+                        help='Only build this many randomly chosen games (seeded), all games by default')
+    parser.add_argument('--manifest', type=str, default='./data/manifest.json',
+                        help='Manifest of per game stage status, timings and failures, used to resume')
+    parser.add_argument('--output_all_folder', type=str, default="./data/plays_all/",
+                        help='Folder to output all play data')
+    parser.add_argument('--output_filtered_folder', type=str, default="./data/plays_filtered/",
+                        help='Folder to output filtered play data')
+    parser.add_argument('--cache', type=str2bool, default=True, help='Reuse parsed games from the game cache')
+    parser.add_argument('--cache_dir', type=str, default=GameCache.DEFAULT_DIR, help='Game cache folder')
+    args = parser.parse_args()
+
+    filenames = sorted(glob(os.path.join(args.data_dir, "*.7z")))
+    if args.sample is not None:
+        random.seed(0)
+        filenames = random.sample(filenames, min(args.sample, len(filenames)))
+    # Longest job first, so that the biggest games do not end up running alone at the end
+    filenames.sort(key=os.path.getsize, reverse=True)
+
+    os.makedirs(os.path.dirname(args.manifest) or '.', exist_ok=True)
+    manifest = load_manifest(args.manifest)
+    options = {'output_all_folder': args.output_all_folder, 'output_filtered_folder': args.output_filtered_folder,
+               'cache': args.cache, 'cache_dir': args.cache_dir}
+    jobs = []
     for filename in filenames:
-        file = filename.split('/')[-1]
-        game_name = file.replace('.7z', '')
+        game_name = os.path.basename(filename).replace('.7z', '')
+        outputs = stage_outputs(game_name, args.output_all_folder, args.output_filtered_folder)
+        stages = pending_stages(manifest.get(game_name, {}), outputs)
+        if stages:
+            jobs.append((game_name, filename, stages, options))
+    print(f"{len(filenames) - len(jobs)} of {len(filenames)} games already built, {len(jobs)} to run")
+    if not jobs:
+        return
+
+    # Index the ESPN data once up front instead of in every worker
+    OutcomeIndex.for_csv(espn_csv_path).close()
 
-        if os.path.exists(f'data/plays_all/{game_name}.json'):
-            continue
-        
-        game_names_to_run.append(game_name)
+    failed = 0
+    # Jobs are handed out in the longest first order
+    for game_name, records in run_games(jobs, max(1, min(args.workers, len(jobs)))):
+        manifest.setdefault(game_name, {}).update(records)
+        save_manifest(manifest, args.manifest)
+        if any(record['status'] == 'failed' for record in records.values()):
+            failed += 1
+            print("Failed", game_name, *(record['error'] for record in records.values() if 'error' in record))
+    print(f"Done, {failed} of {len(jobs)} games failed, see {args.manifest}")
 
-    pool = mp.Pool(4)
-    pool.map(run_command, game_names_to_run)
-    pool.close()
\ No newline at end of file
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,34 @@
-import pandas as pd
-import os
+import argparse
 import glob
+import gzip
+import multiprocessing as mp
+import os
 import re
+import zipfile
 
+import numpy as np
+import pandas as pd
 from tqdm import tqdm
 
+# OutcomeIndex lives at the root of the repository, run this as `python3 -m espn.outcome` from there
+from OutcomeIndex import OutcomeIndexWriter, group_game, index_path_of
+
+
+# Compiled once, every pattern is only tried when the play holds the text it cannot match without
+TECH_FOUL_PATTERN = re.compile(r'(Def 3 sec|Off 3 sec|Tech) tech foul by (.*)')
+TIMEOUT_PATTERN = re.compile(r'(.*?)(?: (full|short|Official))? timeout')
+FG_MADE_PATTERN = re.compile(r'(.*) makes (\d)-pt (.*) from (\d+) ft')
+FG_ASSIST_PATTERN = re.compile(r'(.*) (makes) (\d)-pt (.*) from (\d+) ft \(assist by (.*)\)')
+FG_RIM_PATTERN = re.compile(r'(.*) (makes|misses) (\d)-pt (.*) at rim')
+FG_MISSED_PATTERN = re.compile(r'(.*) misses (\d)-pt (.*) from (\d+) ft')
+FG_PATTERN = re.compile(r'(.*) (misses|makes) (\d)-pt (.*?)(?: \(assist by (.*?)\))?')
+REBOUND_PATTERN = re.compile(r'(Offensive|Defensive) rebound by (.*)')
+TURNOVER_PATTERN = re.compile(r'Turnover by (.*) \((.*)\)')
+FOUL_PATTERN = re.compile(r'(.+?) foul( type \d+)? by (.*) (?:\(drawn by (.*)\))?')
+VIOLATION_PATTERN = re.compile(r'Violation by (.*) \((.*)\)')
+TECHNICAL_OR_PERSONAL_FOUL_PATTERN = re.compile(r'(Technical|Personal) foul by (.*)')
+FT_GENERAL_PATTERN = re.compile(r'(.*) (makes|misses)( technical| flagrant| clear path)? free throw(?: (\d+)(?: of (\d+))?)?')
+
 
 def parse_play(play, away_team, home_team):
     if pd.isna(play) or play.strip() == '':
@@ -26,13 +50,13 @@ def parse_play(play, away_team, home_team):
         return f"{team}jump ball"
 
     # Technical fouls
-    tech_foul_match = re.match(r'(Def 3 sec|Off 3 sec|Tech) tech foul by (.*)', play)
+    tech_foul_match = ' tech foul by ' in play and TECH_FOUL_PATTERN.match(play)
     if tech_foul_match:
         foul_type, player = tech_foul_match.groups()
         return f"{team}{player} {foul_type} technical foul"
 
     # Timeouts
-    timeout_match = re.match(r'(.*?)(?: (full|short|Official))? timeout', play)
+    timeout_match = ' timeout' in play and TIMEOUT_PATTERN.match(play)
     if timeout_match:
         team_name, timeout_type = timeout_match.groups()
         if not team_name.strip():
@@ -40,68 +64,71 @@ def parse_play(play, away_team, home_team):
         else:
             return f"{team_name} {timeout_type} timeout"
 
+    makes = ' makes ' in play
+    misses = ' misses ' in play
+
     # Field Goal Made
-    fg_made_match = re.match(r'(.*) makes (\d)-pt (.*) from (\d+) ft', play)
+    fg_made_match = makes and FG_MADE_PATTERN.match(play)
     if fg_made_match:
         player, points, shot_type, distance = fg_made_match.groups()
         return f"{team}{player} makes {points}-pt {shot_type} from {distance} ft"
     
     # Field Goals with assists
-    fg_assist_match = re.match(r'(.*) (makes) (\d)-pt (.*) from (\d+) ft \(assist by (.*)\)', play)
+    fg_assist_match = makes and FG_ASSIST_PATTERN.match(play)
     if fg_assist_match:
         player, action, points, shot_type, distance, assist_by = fg_assist_match.groups()
         return f"{team}{player} {action} {points}-pt {shot_type} from {distance} ft, assisted by {assist_by}"
 
     # Field Goals with "at rim"
-    fg_rim_match = re.match(r'(.*) (makes|misses) (\d)-pt (.*) at rim', play)
+    fg_rim_match = (makes or misses) and ' at rim' in play and FG_RIM_PATTERN.match(play)
     if fg_rim_match:
         player, action, points, shot_type = fg_rim_match.groups()
         return f"{team}{player} {action} {points}-pt {shot_type} at rim"
 
     # Field Goal Missed
-    fg_missed_match = re.match(r'(.*) misses (\d)-pt (.*) from (\d+) ft', play)
+    fg_missed_match = misses and FG_MISSED_PATTERN.match(play)
     if fg_missed_match:
         player, shot_type, distance = fg_missed_match.groups()[:3]
         return f"{team}{player} misses {shot_type} from {distance} ft"
     
     # Field Goals
-    fg_match = re.match(r'(.*) (misses|makes) (\d)-pt (.*?)(?: \(assist by (.*?)\))?', play)
+    fg_match = (makes or misses) and FG_PATTERN.match(play)
     if fg_match:
         player, action, shot_type, shot_desc, assist_by = fg_match.groups()
         assist_str = f" (assist by {assist_by})" if assist_by else ""
         return f"{team}{player} {action} {shot_type}-pt {shot_desc}{assist_str}"
 
     # Rebounds
-    rebound_match = re.match(r'(Offensive|Defensive) rebound by (.*)', play)
+    rebound_match = ' rebound by ' in play and REBOUND_PATTERN.match(play)
     if rebound_match:
         rebound_type, player = rebound_match.groups()
         return f"{team}{player} {rebound_type.lower()} rebound"
 
     # Turnovers
-    turnover_match = re.match(r'Turnover by (.*) \((.*)\)', play)
+    turnover_match = play.startswith('Turnover by ') and TURNOVER_PATTERN.match(play)
     if turnover_match:
         player, turnover_type = turnover_match.groups()
         return f"{team}{player} turnover ({turnover_type})"
 
     # Fouls
-    foul_match = re.match(r'(.+?) foul( type \d+)? by (.*) (?:\(drawn by (.*)\))?', play)
+    foul_match = ' foul' in play and FOUL_PATTERN.match(play)
     if foul_match:
         foul_type, player, _, drawn_by = foul_match.groups()
         drawn_by_str = f" (drawn by {drawn_by})" if drawn_by else ""
         return f"{team}{player} {foul_type} foul {drawn_by_str}"
     
-    specific_foul_match = re.match(r'Offensive foul by', play)
+    specific_foul_match = play.startswith('Offensive foul by')
     if specific_foul_match:
         return f"{team}Offensive foul"
     
     # Violations and Fouls
-    violation_match = re.match(r'Violation by (.*) \((.*)\)', play)
-    foul_match = re.match(r'(Technical|Personal) foul by (.*)', play)
+    violation_match = play.startswith('Violation by ') and VIOLATION_PATTERN.match(play)
+    foul_match = ' foul by ' in play and TECHNICAL_OR_PERSONAL_FOUL_PATTERN.match(play)
     if violation_match or foul_match:
         return f"{team}{play}"
 
     # General Free Throws (including technical and flagrant)
-    ft_general_match = re.match(r'(.*) (makes|misses)( technical| flagrant| clear path)? free throw(?: (\d+)(?: of (\d+))?)?', play)
+    ft_general_match = (makes or misses) and ' free throw' in play and FT_GENERAL_PATTERN.match(play)
     if ft_general_match:
         player, action, _, current, total = ft_general_match.groups()
         points = '1' if action == 'makes' else '0'
@@ -131,36 +158,135 @@ def assign_weight(outcome):
     else:
         return 0
 
-def process_file(file_path, output_folder):
-    nba_data = pd.read_csv(file_path)
+def classify_plays(plays):
+    """parse_play of every play, each distinct play string is only parsed once
+
+    parse_play does not use the teams, so its outcome only depends on the play.
+    """
+    codes, unique_plays = pd.factorize(plays)
+    # Code -1 is a missing play
+    outcomes = np.array([parse_play(play, None, None) for play in unique_plays] + [None], dtype=object)
+    return outcomes[codes]
+
+
+def assign_weights(outcomes):
+    """assign_weight of every outcome, each distinct outcome is only weighed once"""
+    codes, unique_outcomes = pd.factorize(outcomes)
+    weights = np.array([assign_weight(outcome) for outcome in unique_outcomes] + [assign_weight(None)], dtype=np.int64)
+    return weights[codes]
+
+
+def outcome_rows(nba_data):
+    """The outcome csv rows of raw play by play rows, without the excluded lines"""
     relevant_columns = ['URL', 'Location', 'Date', 'Time', 'Quarter', 'SecLeft', 'AwayTeam', 'HomeTeam', 'AwayPlay', 'HomePlay']
     nba_relevant_data = nba_data[relevant_columns].copy()
     nba_relevant_data['Game'] = nba_relevant_data['URL'].apply(lambda x: x.split('/')[-1].split('.')[0])
     nba_relevant_data = nba_relevant_data.drop('URL', axis=1)
-    nba_relevant_data['Outcome'] = nba_relevant_data.apply(
-        lambda row: parse_play(row['AwayPlay'], row['AwayTeam'], row['HomeTeam']) or
-                    parse_play(row['HomePlay'], row['AwayTeam'], row['HomeTeam']),
-        axis=1
-    )
+    # The away play's outcome, or the home play's when the away side has none
+    outcomes = classify_plays(pd.concat([nba_relevant_data['AwayPlay'], nba_relevant_data['HomePlay']]))
+    away_outcomes, home_outcomes = outcomes[:len(nba_relevant_data)], outcomes[len(nba_relevant_data):]
+    nba_relevant_data['Outcome'] = np.where(pd.notna(away_outcomes), away_outcomes, home_outcomes)
     nba_relevant_data = nba_relevant_data.drop(['AwayPlay', 'HomePlay'], axis=1)
 
     # Exclude lines marked as 'Exclude Line'
     nba_relevant_data = nba_relevant_data[nba_relevant_data['Outcome'] != 'Exclude Line']
 
     # Add weights column
-    nba_relevant_data['Weight'] = nba_relevant_data['Outcome'].apply(assign_weight)
+    nba_relevant_data['Weight'] = assign_weights(nba_relevant_data['Outcome'])
+    return nba_relevant_data
+
+
+def process_file(file_path, output_folder):
+    nba_data = pd.read_csv(file_path)
+    nba_relevant_data = outcome_rows(nba_data)
 
     file_name = os.path.basename(file_path)
     output_file_path = os.path.join(output_folder, file_name + '.gz')
     nba_relevant_data.to_csv(output_file_path, index=False, compression='gzip')
 
 
-data_folder = 'data'
-outcomes_folder = 'outcomes'
+def read_play_chunks(file_path, chunksize):
+    """Reads a play by play .csv, .csv.gz or zipped csv in chunks of rows"""
+    if file_path.endswith('.zip'):
+        with zipfile.ZipFile(file_path) as archive:
+            member = next(name for name in archive.namelist()
+                          if name.endswith('.csv') and not name.startswith('__MACOSX/'))
+            with archive.open(member) as file:
+                with pd.read_csv(file, chunksize=chunksize) as reader:
+                    yield from reader
+    else:
+        with pd.read_csv(file_path, chunksize=chunksize) as reader:
+            yield from reader
+
+
+def stream_file(file_path, output_folder, chunksize=100000):
+    """process_file reading and writing chunk by chunk, straight from .zip or .gz archives
+
+    Also writes the per game outcome index that get_play_data reads, one
+    game at a time as its rows complete, so memory stays at about one chunk
+    whatever the size of the season. Rows of a game have to be contiguous.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    name = os.path.basename(file_path).split('.csv')[0]
+    output_file_path = os.path.join(output_folder, name + '.csv.gz')
+    partial_path = output_file_path + '.partial'
+    writer = OutcomeIndexWriter(index_path_of(output_file_path))
+    try:
+        pending = None  # rows of the last game seen, it may go on in the next chunk
+        with gzip.open(partial_path, 'wt', encoding='utf-8', newline='') as csv_file:
+            for chunk_id, chunk in enumerate(read_play_chunks(file_path, chunksize)):
+                rows = outcome_rows(chunk)
+                rows.to_csv(csv_file, header=chunk_id == 0, index=False)
+                if pending is not None:
+                    rows = pd.concat([pending, rows])
+                if not len(rows):
+                    continue
+                last_game = rows['Game'].iloc[-1]
+                for game, game_rows in rows[rows['Game'] != last_game].groupby('Game', sort=False):
+                    writer.add(game, group_game(game_rows))
+                pending = rows[rows['Game'] == last_game]
+        if pending is not None:
+            writer.add(pending['Game'].iloc[0], group_game(pending))
+        os.replace(partial_path, output_file_path)
+    except BaseException:
+        writer.abort()
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    # Closed after the csv is in place, an index older than its csv is rebuilt
+    writer.close()
+    return output_file_path
+
+
+def _stream_file(args):
+    return stream_file(*args)
+
+
+def process_archives(file_paths, output_folder, workers=None, chunksize=100000):
+    """Streams several seasons at once, one worker process per season"""
+    os.makedirs(output_folder, exist_ok=True)
+    workers = min(workers or mp.cpu_count(), len(file_paths))
+    jobs = [(file_path, output_folder, chunksize) for file_path in file_paths]
+    if workers <= 1:
+        return [stream_file(*job) for job in tqdm(jobs)]
+    with mp.Pool(workers) as pool:
+        return list(tqdm(pool.imap_unordered(_stream_file, jobs), total=len(jobs)))
+
+
+data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+outcomes_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outcomes')
 
 
 if __name__ == '__main__':
-    if not os.path.exists(outcomes_folder):
-        os.makedirs(outcomes_folder)
-    for file_path in tqdm(glob.glob(os.path.join(data_folder, '*.csv'))):
-        process_file(file_path, outcomes_folder)
+    parser = argparse.ArgumentParser(description='Classify the outcome of every ESPN play by play row.')
+    parser.add_argument('--data_folder', type=str, default=data_folder,
+                        help='Folder with play by play .csv, .csv.gz or .zip files')
+    parser.add_argument('--outcomes_folder', type=str, default=outcomes_folder, help='Folder to output outcomes')
+    parser.add_argument('--workers', type=int, default=None, help='Seasons processed at once, all cores by default')
+    parser.add_argument('--chunksize', type=int, default=100000, help='Rows read at a time')
+    args = parser.parse_args()
+
+    file_paths = sorted(glob.glob(os.path.join(args.data_folder, '*.csv')) +
+                        glob.glob(os.path.join(args.data_folder, '*.csv.gz')) +
+                        glob.glob(os.path.join(args.data_folder, '*.zip')))
+    process_archives(file_paths, args.outcomes_folder, args.workers, args.chunksize)
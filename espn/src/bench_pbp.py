@@ -0,0 +1,39 @@
+import argparse, os, time
+from glob import glob
+
+from scrape_pbp import breakdown, parse_page
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def parsers():
+    available = ['html.parser']
+    try:
+        import lxml
+        available.insert(0, 'lxml')
+    except ImportError:
+        pass
+    return available
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time parsing the saved Basketball-Reference play by play pages.')
+    parser.add_argument('--fixtures', type=str, default=FIXTURES, help='Folder with saved play by play .html pages')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per page, the fastest one is reported')
+    args = parser.parse_args()
+
+    for path in sorted(glob(os.path.join(args.fixtures, '*.html'))):
+        name = os.path.basename(path)
+        with open(path) as file:
+            page = file.read()
+        for backend in parsers():
+            seconds = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                rows = breakdown(parse_page(page, '/boxscores/' + name, parser=backend))
+                seconds.append(time.perf_counter() - start)
+            print(f"{name} {backend}: {len(rows)} rows in {min(seconds):.3f}s")
+
+
+if __name__ == '__main__':
+    main()
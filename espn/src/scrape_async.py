@@ -0,0 +1,220 @@
+import argparse, asyncio, json, os, random, time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from scrape_pbp import HEADER, PBP_URL, breakdown, parse_page
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to burst requests"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Waiting under the lock hands the tokens out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Checkpoint:
+    """An append-only log of scraped games and how far into the output csv their rows go
+
+    Every game is logged only after its rows are flushed to the csv, so on
+    resume the csv is cut back to the end of the last logged game and any
+    rows of a game that was being written during a crash are dropped. The
+    first run logs where the csv ends before any game, so this also holds
+    for a crash before the first game is logged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.failed = {}
+        self.end = None
+        torn = False
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    torn = not line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+                    if entry['status'] == 'done':
+                        self.done.add(entry['link'])
+                        self.failed.pop(entry['link'], None)
+                        self.end = entry['end']
+                    elif entry['status'] == 'opened':
+                        self.end = entry['end']
+                    else:
+                        self.failed[entry['link']] = entry['error']
+        self._file = open(path, 'a')
+        if torn:
+            self._file.write('\n')
+
+    def log(self, **entry):
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class RetryableError(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f'HTTP {status}')
+        self.retry_after = float(retry_after) if retry_after and retry_after.isdigit() else None
+
+
+def make_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch(session, url, timeout):
+    r = session.get(url, timeout=timeout)
+    if r.status_code in RETRY_STATUSES:
+        raise RetryableError(r.status_code, r.headers.get('Retry-After'))
+    r.raise_for_status()
+    return r.text
+
+
+def scrape_game(session, link, base_url, timeout):
+    page = fetch(session, base_url + link.split('/')[-1], timeout)
+    return breakdown(parse_page(page, link))
+
+
+async def scrape_with_retries(session, bucket, link, args):
+    for attempt in range(args.retries + 1):
+        await bucket.acquire()
+        try:
+            return await asyncio.to_thread(scrape_game, session, link, args.base_url, args.timeout)
+        except (RetryableError, requests.ConnectionError, requests.Timeout) as e:
+            if attempt == args.retries:
+                raise
+            delay = args.backoff * 2 ** attempt * random.uniform(1, 1.5)
+            if isinstance(e, RetryableError) and e.retry_after is not None:
+                delay = max(delay, e.retry_after)
+            print(f'Retrying {link} in {delay:.1f}s after {e}')
+            await asyncio.sleep(delay)
+
+
+async def scrape(links, output, checkpoint, args):
+    session = make_session(args.concurrency)
+    bucket = TokenBucket(args.rate, args.burst)
+    queue = asyncio.Queue()
+    for link in links:
+        queue.put_nowait(link)
+    counts = {'done': 0, 'failed': 0}
+
+    async def worker():
+        while not queue.empty():
+            link = queue.get_nowait()
+            try:
+                plays = await scrape_with_retries(session, bucket, link, args)
+            except Exception as e:
+                checkpoint.log(link=link, status='failed', error=f'{type(e).__name__}: {e}')
+                counts['failed'] += 1
+                print('Failed', link, e)
+                continue
+            # Writes happen on the event loop only, one game's rows are never interleaved with another's
+            output.write(''.join('\n' + ','.join([str(d) for d in play]) for play in plays).encode('utf-8'))
+            output.flush()
+            os.fsync(output.fileno())
+            checkpoint.log(link=link, status='done', end=output.tell())
+            counts['done'] += 1
+            print(f"{len(links) - counts['done'] - counts['failed']} -- {link}")
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    finally:
+        session.close()
+    return counts
+
+
+def open_output(path, checkpoint):
+    # Binary, so that tell() is the byte offset the checkpoint truncates to
+    output = open(path, 'a+b')
+    output.seek(0, os.SEEK_END)
+    if checkpoint.end is not None:
+        if output.tell() < checkpoint.end:
+            raise ValueError(f'{path} is shorter than {checkpoint.path} says, they do not belong together')
+        output.truncate(checkpoint.end)
+    else:
+        if output.tell() == 0:
+            output.write(HEADER.encode('utf-8'))
+        output.flush()
+        os.fsync(output.fileno())
+        # Rows already in the csv, like the old scraper's, are kept and anything after them is ours
+        checkpoint.log(status='opened', end=output.tell())
+        checkpoint.end = output.tell()
+    output.seek(0, os.SEEK_END)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scrape Basketball-Reference play by play pages concurrently.')
+    parser.add_argument('--links', type=str, default='gamelinks.txt', help='File with one game link per line')
+    parser.add_argument('--done_links', type=str, default='donelinks.txt',
+                        help='Links scraped by the old scraper, skipped when the file exists')
+    parser.add_argument('--output', type=str, default='output_pbp.csv', help='Play by play csv to append to')
+    parser.add_argument('--checkpoint', type=str, default='scrape_checkpoint.jsonl',
+                        help='Append-only log of scraped games, used to resume')
+    parser.add_argument('--base_url', type=str, default=PBP_URL, help='Where the play by play pages are served from')
+    parser.add_argument('--rate', type=float, default=0.25, help='Requests per second on average')
+    parser.add_argument('--burst', type=int, default=1, help='Requests that may go out at once after a pause')
+    parser.add_argument('--concurrency', type=int, default=4, help='Games in flight at once')
+    parser.add_argument('--retries', type=int, default=5, help='Retries of a failed request')
+    parser.add_argument('--backoff', type=float, default=5.0, help='Seconds before the first retry, doubled after')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Seconds before a request times out')
+    parser.add_argument('--retry_failed', action='store_true', help='Also retry games that failed before')
+    args = parser.parse_args()
+
+    with open(args.links) as file:
+        links = [x.strip() for x in file if x.strip()]
+    checkpoint = Checkpoint(args.checkpoint)
+    skip = set(checkpoint.done)
+    if os.path.exists(args.done_links):
+        with open(args.done_links) as file:
+            skip.update(x.strip() for x in file)
+    if not args.retry_failed:
+        skip.update(checkpoint.failed)
+    links = list(dict.fromkeys(link for link in links if link not in skip))
+    print(f'{len(links)} games to scrape')
+
+    output = open_output(args.output, checkpoint)
+    loop = asyncio.new_event_loop()
+    # One thread per game in flight, the default executor can be smaller than the concurrency
+    loop.set_default_executor(ThreadPoolExecutor(args.concurrency))
+    try:
+        counts = loop.run_until_complete(scrape(links, output, checkpoint, args))
+    finally:
+        loop.close()
+        output.close()
+        checkpoint.close()
+    print(f"Done, {counts['done']} scraped, {counts['failed']} failed, see {args.checkpoint}")
+
+
+if __name__ == '__main__':
+    main()
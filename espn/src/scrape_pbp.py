@@ -2,17 +2,14 @@ from time import sleep
 import re, os, requests
 from bs4 import BeautifulSoup as bsp
 
-t = open('gamelinks.txt','r')
 try:
-    donet = open('donelinks.txt','r')
-except:
-    donet = open('donelinks.txt','w')
-    donet.close()
-    donet = open('donelinks.txt','r')
-game_links = [x.replace('\n','') for x in t.readlines()]
-done_links = [x.replace('\n','') for x in donet.readlines()]
-game_links = [x for x in game_links if x not in done_links]
-t.close()
+    import lxml
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+PBP_URL = 'https://www.basketball-reference.com/boxscores/pbp/'
+HEADER = 'URL,GameType,Location,Date,Time,WinningTeam,Quarter,SecLeft,AwayTeam,AwayPlay,AwayScore,HomeTeam,HomePlay,HomeScore,Shooter,ShotType,ShotOutcome,ShotDist,Assister,Blocker,FoulType,Fouler,Fouled,Rebounder,ReboundType,ViolationPlayer,ViolationType,TimeoutTeam,FreeThrowShooter,FreeThrowOutcome,FreeThrowNum,EnterGame,LeaveGame,TurnoverPlayer,TurnoverType,TurnoverCause,TurnoverCauser,JumpballAwayPlayer,JumpballHomePlayer,JumpballPoss'
 
 def involved(string):
     return([a['href'].split('/')[-1].split('.')[0] for a in string.find_all('a')])
@@ -202,58 +199,49 @@ def timeleft_to_sec(t):
   sec = int(t[s+1:s1])
   return min + sec
 
+# Every parser, the width of its columns and a cheap test on the text and words of the play.
+# A parser can only return anything but empty columns when its test passes, so it is skipped otherwise.
+PLAY_PARSERS = [
+    (shot, 6, lambda text, words: 'makes' in words or 'misses' in words),
+    (foul, 3, lambda text, words: 'foul' in text),
+    (rebound, 2, lambda text, words: 'rebound' in text),
+    (violation, 2, lambda text, words: 'Violation' in text),
+    (timeout, 1, lambda text, words: 'timeout' in text),
+    (freethrow, 3, lambda text, words: 'makes' in text or 'misses' in words),
+    (entergame, 2, lambda text, words: 'enters' in words and 'for' in words),
+    (turnover, 4, lambda text, words: 'Turnover' in text),
+    (jumpball, 3, lambda text, words: 'Jump ball' in text),
+]
+
 def play_caller(string):
-    try:
-        is_shot = list(shot(string))
-    except:
-        is_shot = ['','','','','','']
-    try:
-        is_foul = list(foul(string))
-    except:
-        is_foul = ['','','']
-    try:
-        is_rbd = list(rebound(string))
-    except:
-        is_rbd = ['','']
-    try:
-        is_vio = list(violation(string))
-    except:
-        is_vio = ['','']
-    try:
-        is_to = list(timeout(string))
-    except:
-        is_to = ['']
-    try:
-        is_ft = list(freethrow(string))
-    except:
-        is_ft = ['','','']
-    try:
-        is_ent = list(entergame(string))
-    except:
-        is_ent = ['','']
-    try:
-        is_turn = list(turnover(string))
-    except:
-        is_turn = ['','','','']
-    try:
-        is_jump = list(jumpball(string))
-    except:
-        is_jump = ['','','']
-    return is_shot + is_foul + is_rbd + is_vio + is_to + is_ft + is_ent + is_turn + is_jump
+    # Plays that are not table cells, like 'End of Game', have no text and make every parser fail
+    text = getattr(string, 'text', None)
+    words = text.split(' ') if text is not None else None
+    called = []
+    for parser, width, matches in PLAY_PARSERS:
+        result = [''] * width
+        if text is not None and matches(text, words):
+            try:
+                result = list(parser(string))
+            except:
+                pass
+        called += result
+    return called
 
 ## shooter,shottype,outcome,dist,assister,blocker,foultype,byplayer,drawnplayer,reboundplayer,reboundtype,violplayer,violationtype,timeoutteam,ftshooter,ftoutcome,ftn,enterer,leaver,turnoverplayer,turntype,act1,perp,jbplayer1, jbplayer2, jbposs
 
-def pbp2(link):
-    url = 'https://www.basketball-reference.com/boxscores/pbp/' + link.split('/')[-1]
-    r = requests.get(url)
-    r=r.text
-    soup = bsp(r, 'html.parser')
+def fetch_page(link, session=None, base_url=PBP_URL):
+    url = base_url + link.split('/')[-1]
+    r = (session or requests).get(url)
+    return r.text
+
+def parse_page(r, link, parser=PARSER):
+    soup = bsp(r, parser)
     plays = []
-    dog = ' '.join(soup.find('div',class_='scorebox').find('div',class_='scorebox_meta').find('div').get_text().split(', ')[1:]).replace(',','')
-    log = soup.find('div',class_='scorebox').find('div',class_='scorebox_meta').find_all('div')[1].get_text().replace(',','')
-    tog = soup.find('div',class_='scorebox').find('div',class_='scorebox_meta').find('div').get_text().split(',')[0]
-    comment = soup.find(text=re.compile("table_outer_container"))
-    com = soup
+    meta = soup.find('div',class_='scorebox').find('div',class_='scorebox_meta')
+    dog = ' '.join(meta.find('div').get_text().split(', ')[1:]).replace(',','')
+    log = meta.find_all('div')[1].get_text().replace(',','')
+    tog = meta.find('div').get_text().split(',')[0]
     awayTeamabbr,homeTeamabbr = [x.split('/')[2] for x in [a['href'] for a in soup.find('div',class_='scorebox').find_all('a') if 'teams' in a['href']]]
     awayFinScore = soup.find_all('div',class_='score')[0].get_text()
     homeFinScore = soup.find_all('div',class_='score')[1].get_text()
@@ -268,10 +256,13 @@ def pbp2(link):
     elif int(awayFinScore) < int(homeFinScore):
         winningTeam = homeTeamabbr
     #print('read\nplays')
-    for i in range(2,len(soup.find('table',id='pbp').find_all('tr'))):
+    # Rows and their cells are looked up once, the table used to be searched again for every cell
+    rows = soup.find('table',id='pbp').find_all('tr')
+    for i in range(2,len(rows)):
+        cells = rows[i].find_all('td')
         try:
-            time = soup.find('table',id='pbp').find_all('tr')[i].find_all('td')[0].text.replace('\n','')
-            awayPlay = soup.find('table',id='pbp').find_all('tr')[i].find_all('td')[1]
+            time = cells[0].text.replace('\n','')
+            awayPlay = cells[1]
             if 'Start of' in awayPlay.text:
                 pass
             elif 'End' in awayPlay.text:
@@ -286,16 +277,17 @@ def pbp2(link):
                 homePlay = ''
                 plays.append([link,gameType,log,dog,tog,winningTeam,q,time,awayTeamabbr,awayPlay,awayScore,homeTeamabbr,homePlay,homeScore])
             else:
-                awayScore = soup.find('table',id='pbp').find_all('tr')[i].find_all('td')[3].text.replace('\n','').split('-')[0]
-                homeScore = soup.find('table',id='pbp').find_all('tr')[i].find_all('td')[3].text.replace('\n','').split('-')[1]
-                homePlay = soup.find('table',id='pbp').find_all('tr')[i].find_all('td')[5]
+                score = cells[3].text.replace('\n','').split('-')
+                awayScore = score[0]
+                homeScore = score[1]
+                homePlay = cells[5]
                 plays.append([link,gameType,log,dog,tog,winningTeam,q,time,awayTeamabbr,awayPlay,awayScore,homeTeamabbr,homePlay,homeScore])
         except:
             try:
                 if len(plays) == 0:
                     q = 1
-                    time = soup.find('table',id='pbp').find_all('tr')[i].find_all('td')[0].text.replace('\n','')
-                    jb = soup.find('table',id='pbp').find_all('tr')[i].find_all('td')[1]
+                    time = cells[0].text.replace('\n','')
+                    jb = cells[1]
                     plays.append([link,gameType,log,dog,tog,winningTeam,q,time,awayTeamabbr,jb,0,homeTeamabbr,'',0])
             except:
                 pass
@@ -306,6 +298,9 @@ def pbp2(link):
     plays[-1][6]-=1
     return plays
 
+def pbp2(link, session=None):
+    return parse_page(fetch_page(link, session), link)
+
 def breakdown(plays):
     broke = []
     for play in plays:
@@ -328,51 +323,67 @@ def breakdown(plays):
                 brek[-13] = brek[11]
     return broke
 
-y = open('output_pbp.csv','a')
-if os.stat('output_pbp.csv').st_size == 0:
-    y.write('URL,GameType,Location,Date,Time,WinningTeam,Quarter,SecLeft,AwayTeam,AwayPlay,AwayScore,HomeTeam,HomePlay,HomeScore,Shooter,ShotType,ShotOutcome,ShotDist,Assister,Blocker,FoulType,Fouler,Fouled,Rebounder,ReboundType,ViolationPlayer,ViolationType,TimeoutTeam,FreeThrowShooter,FreeThrowOutcome,FreeThrowNum,EnterGame,LeaveGame,TurnoverPlayer,TurnoverType,TurnoverCause,TurnoverCauser,JumpballAwayPlayer,JumpballHomePlayer,JumpballPoss')
+def main():
+    t = open('gamelinks.txt','r')
+    try:
+        donet = open('donelinks.txt','r')
+    except:
+        donet = open('donelinks.txt','w')
+        donet.close()
+        donet = open('donelinks.txt','r')
+    game_links = [x.replace('\n','') for x in t.readlines()]
+    done_links = [x.replace('\n','') for x in donet.readlines()]
+    game_links = [x for x in game_links if x not in done_links]
+    t.close()
 
-t = 1
-used_links = []
-for link in game_links:
-   if t % 15 ==0 and t != 0:
-      print('Sleeping...')
-      try:
-        sleep(20)
-      except:
-         b = open('gamelinks.txt','w')
-         for link in list(set(game_links) - set(used_links)):
-             b.write(link + '\n')
-         b.close()
-         c = open('donelinks.txt','a')
-         for link in used_links:
-             c.write(link + '\n')
-         c.close()
-         y.close()
-         break
-   try:
-      bd = breakdown(pbp2(link))
-      for play in bd:
-        y.write('\n'+','.join([str(d) for d in play]))
-      used_links.append(link)
-      print(str(len(game_links) - len(used_links) +1) + ' -- ' + link)
-      sleep(3)
-      t+=1
-      if link == game_links[-1]:
+    y = open('output_pbp.csv','a')
+    if os.stat('output_pbp.csv').st_size == 0:
+        y.write(HEADER)
+
+    t = 1
+    used_links = []
+    for link in game_links:
+       if t % 15 ==0 and t != 0:
+          print('Sleeping...')
+          try:
+            sleep(20)
+          except:
+             b = open('gamelinks.txt','w')
+             for link in list(set(game_links) - set(used_links)):
+                 b.write(link + '\n')
+             b.close()
+             c = open('donelinks.txt','a')
+             for link in used_links:
+                 c.write(link + '\n')
+             c.close()
+             y.close()
+             break
+       try:
+          bd = breakdown(pbp2(link))
+          for play in bd:
+            y.write('\n'+','.join([str(d) for d in play]))
+          used_links.append(link)
+          print(str(len(game_links) - len(used_links) +1) + ' -- ' + link)
+          sleep(3)
+          t+=1
+          if link == game_links[-1]:
+              b = open('gamelinks.txt','w')
+              b.close()
+              c = open('donelinks.txt','a')
+              for link in used_links:
+                  c.write(link + '\n')
+              c.close()
+       except:
           b = open('gamelinks.txt','w')
+          for link in list(set(game_links) - set(used_links)):
+              b.write(link + '\n')
           b.close()
           c = open('donelinks.txt','a')
           for link in used_links:
               c.write(link + '\n')
           c.close()
-   except:
-      b = open('gamelinks.txt','w')
-      for link in list(set(game_links) - set(used_links)):
-          b.write(link + '\n')
-      b.close()
-      c = open('donelinks.txt','a')
-      for link in used_links:
-          c.write(link + '\n')
-      c.close()
-      y.close()
-      break
+          y.close()
+          break
+
+if __name__ == '__main__':
+    main()
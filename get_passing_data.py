@@ -4,17 +4,15 @@ import json
 import os.path
 import pathlib
 
-import matplotlib.animation as animation
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
-from py7zr import SevenZipFile
-from tqdm.auto import tqdm
 
 from Constant import *
-from Event import Event
+from FrameWriter import FrameWriter
 from Game import Game
-from Team import Team
+from GameCache import GameCache, parse_game
+from PassStore import PassStore
+from possession import (detect_passes_parallel, determine_possessors, get_nearest_players, get_pass_distances,
+                        segment_passes)
 
 
 def str2bool(v):
@@ -26,258 +24,194 @@ def str2bool(v):
         return False
 
 
-# Argument parser setup
-parser = argparse.ArgumentParser(description='Generate basketball game animation and passing data.')
-parser.add_argument('--path', type=str, default="./data/0021500061.json", help='Path to game JSON data.')
-parser.add_argument('--event', type=int, default=-1, help='Event index to visualize and analyze. -1 for all events')
-parser.add_argument('--save_json', type=str2bool, default=True, help='Save passing data')
-parser.add_argument('--gif', type=str2bool, default=False, help='Draw gifs for the input event')
-parser.add_argument('--scaling_factor', type=int, default=5, help='Scaling factor for ball size in visualization.')
-parser.add_argument('--output_dir', type=str, default='.', help='Outpuf folder')
-args = parser.parse_args()
-
-if args.path.endswith('.7z'):
-    print("Uncompressing Basket Ball Event Data")
-    with SevenZipFile(args.path, mode='r') as z:
-        extract_path = os.path.splitext(args.path)[0]
-        z.extractall(path=extract_path)
-        data_frame = pd.read_json(os.path.join(extract_path, z.getnames()[0]))
-else:
-    data_frame = pd.read_json(args.path)
-
-total_events = len(data_frame)
-
-path = args.path
-event = args.event
-scaling_factor = args.scaling_factor
-
-
-def filter_ball_attributes(ball):
-    return {k: v for k, v in vars(ball).items() if k != "color"}
-
-
-def filter_player_attributes(player):
-    return {k: v for k, v in vars(player).items() if k not in ("team", "color")}
-
-
-def format_players_by_team(game, moments, team_name):
-    return {
-        game.event.player_ids_dict[player.id][0]: filter_player_attributes(player)
-        for player in moments.players
-        if player.team.name == team_name
-    }
-
-
-def reformat_dict(game):
-    time_snapshots = []
-    for moment in game.event.moments:
-        moment_data = {
-            "Ball": filter_ball_attributes(moment.ball),
-            "HomePlayers": format_players_by_team(game, moment, game.home_team.name),
-            "GuestPlayers": format_players_by_team(game, moment, game.guest_team.name),
-            "GameClock": moment.game_clock,
-            "Quarter": moment.quarter,
-            "ShotClock": moment.shot_clock
-        }
-        time_snapshots.append(moment_data)
-    return time_snapshots
-
-
-def get_speed(ball_1, ball_2):
-    return np.sqrt((ball_1["x"] - ball_2["x"]) ** 2 + (ball_1["y"] - ball_2["y"]) ** 2)
-
-
-def determine_possessor(data, speed_threshold, radius_threshold):
-    last_possessors = [None] * len(data)
-    last_possessor = None
-
-    for idx in range(1, len(data)):
-        ball_prev = data[idx - 1]["Ball"]
-        ball_now = data[idx]["Ball"]
-
-        speed = get_speed(ball_prev, ball_now)
-        if speed < speed_threshold and ball_now["radius"] < radius_threshold and bool(
-                data[idx]["HomePlayers"]) and bool(data[idx]["GuestPlayers"]):
-            home_player, d1 = get_nearest_position(ball_now, data[idx]["HomePlayers"].values())
-            guest_player, d2 = get_nearest_position(ball_now, data[idx]["GuestPlayers"].values())
-            possessor = home_player if d1 < d2 else guest_player
-            last_possessor = possessor['id']
-
-        last_possessors[idx] = last_possessor
-
-    return last_possessors
-
-
-def plot_players(ax, players, color, marker, size=5):
-    for player in players:
-        ax.scatter(player["x"], player["y"], s=size, c=color, marker=marker)
-
-
-def get_nearest_position(ball_position, players):
-    distances = [np.sqrt((ball_position["x"] - player["x"]) ** 2 + (ball_position["y"] - player["y"]) ** 2) for player
-                 in players]
-    nearest_index = np.argmin(distances)
-    return [*players][nearest_index], [*distances][nearest_index]
-
-
-def initialize_plot():
-    fig, ax = plt.subplots(figsize=(8, 5))
-    ax.set_xlim([Constant.X_MIN, Constant.X_MAX])
-    ax.set_ylim([Constant.Y_MIN, Constant.Y_MAX])
-    ax.set_aspect('equal')
-    return fig, ax
-
-
 # Constants for ball possession
 SPEED_THRESHOLD = 1
 RADIUS_THRESHOLD = 5
 
-from itertools import compress
-
-
-def draw_gif(time_snapshots, event, game_name, game):
-    ball_data = list(compress(time_snapshots,
-                              ('x' in entry["Ball"] and 'y' in entry["Ball"] and 'radius' in entry["Ball"] for entry in
-                               time_snapshots)))
-    x_positions = [entry["Ball"]["x"] for entry in ball_data]
-    y_positions = [entry["Ball"]["y"] for entry in ball_data]
-    sizes = [entry["Ball"]["radius"] * scaling_factor for entry in ball_data]
-
-    last_possessors = determine_possessor(time_snapshots, SPEED_THRESHOLD, RADIUS_THRESHOLD)
-    progress_bar = tqdm(total=len(ball_data) + 1, desc="Rendering GIF", position=0, leave=True)
-    fig, ax = initialize_plot()
-
-    # Precompute plot limits and aspect ratio
-    xlim = [Constant.X_MIN, Constant.X_MAX]
-    ylim = [Constant.Y_MIN, Constant.Y_MAX]
-    aspect = 'equal'
-
-    def update(num, x_positions, y_positions, sizes, last_possessors):
-        ax.clear()
-        ax.set_xlim(xlim)
-        ax.set_ylim(ylim)
-        ax.set_aspect(aspect)
-        possessor_id = last_possessors[num]
-        color = "red" if possessor_id is not None and game.event.player_ids_dict[possessor_id][
-            1] == game.home_team else "blue"
-        plot_players(ax, ball_data[num]["HomePlayers"].values(), 'orange', 'o')
-        plot_players(ax, ball_data[num]["GuestPlayers"].values(), 'purple', 'o')
-        home_player, _ = get_nearest_position(ball_data[num]["Ball"], ball_data[num]["HomePlayers"].values())
-        guest_player, _ = get_nearest_position(ball_data[num]["Ball"], ball_data[num]["GuestPlayers"].values())
-
-        # Draw last possessor with special handling
-        for player, team_color, shape in [(home_player, 'orange', 'D'), (guest_player, 'purple', 's')]:
-            size = 30 if player["id"] == last_possessors[num] else 20
-            ax.scatter(player["x"], player["y"], s=size, c='red' if size == 30 else team_color, marker=shape)
-
-        ax.scatter(x_positions[num], y_positions[num], s=sizes[num], c=color)
-        progress_bar.update(1)
-
-    ani = animation.FuncAnimation(fig, update, frames=len(ball_data),
-                                  fargs=(x_positions, y_positions, sizes, last_possessors), repeat=False)
-
-    plt.close(fig)
-    ani.save(f'{game_name}_Event{event}.gif', writer='imagemagick', fps=25, dpi=80)
-    progress_bar.close()
-
-
-def read_json(game):
-    index = game.event_index
-    event = data_frame['events'][index]
-    game.event = Event(event)
-    game.home_team = Team(event['home']['teamid'])
-    game.guest_team = Team(event['visitor']['teamid'])
-    h = hash(json.dumps([*data_frame['events'][index]['moments']]))
-    return h
 
+def draw_gif(trajectory, possessors, home_team_id, guest_team_id, path, scaling_factor=5, fps=25, dpi=80):
+    """Renders the trajectory with the ball, both teams and the player of each team nearest to the ball
+
+    The nearest player of each team is drawn bigger and in red when it is the
+    last possessor, the ball is red while a home player had it last. Artists
+    are created once and only moved every frame, and the frames are blitted
+    over the axes drawn once. .gif is encoded with Pillow, other formats with ffmpeg.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from tqdm.auto import tqdm
+
+    frames = len(trajectory)
+    players = trajectory.players[:, :, :2]
+    team_ids = trajectory.team_ids[:, 1:]
+    player_ids = trajectory.player_ids[:, 1:]
+    is_home = team_ids == home_team_id
+    is_guest = team_ids == guest_team_id
+    # The same nearest players possession was detected from
+    home_nearest, home_distances = get_nearest_players(trajectory, home_team_id)
+    guest_nearest, guest_distances = get_nearest_players(trajectory, guest_team_id)
+    home_nearest_has_ball = player_ids[np.arange(frames), home_nearest] == possessors
+    guest_nearest_has_ball = player_ids[np.arange(frames), guest_nearest] == possessors
+    ball_with_home = np.isin(possessors, trajectory.player_ids[trajectory.team_ids == home_team_id])
+    ball = trajectory.ball
+    ball_sizes = ball[:, 2] * scaling_factor
+
+    fig = Figure(figsize=(8, 5), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_xlim([Constant.X_MIN, Constant.X_MAX])
+    ax.set_ylim([Constant.Y_MIN, Constant.Y_MAX])
+    ax.set_aspect('equal')
+    empty = np.zeros((0, 2))
+    home_scatter = ax.scatter(empty[:, 0], empty[:, 1], s=5, c='orange', marker='o', animated=True)
+    guest_scatter = ax.scatter(empty[:, 0], empty[:, 1], s=5, c='purple', marker='o', animated=True)
+    home_nearest_scatter = ax.scatter(empty[:, 0], empty[:, 1], marker='D', animated=True)
+    guest_nearest_scatter = ax.scatter(empty[:, 0], empty[:, 1], marker='s', animated=True)
+    ball_scatter = ax.scatter(empty[:, 0], empty[:, 1], animated=True)
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+    width, height = canvas.get_width_height()
+
+    nearest = [(home_nearest_scatter, home_nearest, home_distances, home_nearest_has_ball, 'orange'),
+               (guest_nearest_scatter, guest_nearest, guest_distances, guest_nearest_has_ball, 'purple')]
+    with FrameWriter(path, width, height, fps) as writer:
+        for num in tqdm(range(frames), desc="Rendering GIF", position=0, leave=True):
+            canvas.restore_region(background)
+            home_scatter.set_offsets(players[num][is_home[num]])
+            guest_scatter.set_offsets(players[num][is_guest[num]])
+            for scatter, slots, distances, has_ball, team_color in nearest:
+                # A team without players on the court has no nearest player
+                scatter.set_offsets(players[num, slots[num]][None] if np.isfinite(distances[num]) else empty)
+                scatter.set_sizes([30 if has_ball[num] else 20])
+                scatter.set_color('red' if has_ball[num] else team_color)
+            # A moment without the ball has no ball to draw
+            ball_scatter.set_offsets(ball[num, None, :2] if np.isfinite(ball[num, :2]).all() else empty)
+            ball_scatter.set_sizes(ball_sizes[num, None])
+            ball_scatter.set_color('red' if ball_with_home[num] else 'blue')
+            for scatter in (home_scatter, guest_scatter, home_nearest_scatter, guest_nearest_scatter, ball_scatter):
+                ax.draw_artist(scatter)
+            writer.write(np.asarray(canvas.buffer_rgba()))
+    return path
+
+
+def calculate_passing(trajectory, possessors, player_ids_dict, passes=None):
+    # Every pass is a run of frames between two possessor changes, kept as a frame range
+    if passes is None:
+        starts, stops = segment_passes(possessors)
+        passes = starts, stops, get_pass_distances(trajectory, starts, stops)
+    starts, stops, distances = passes
+    possessors = possessors.tolist()
+    game_clocks = trajectory.game_clock.tolist()
+    quarters = trajectory.quarter.tolist()
+    shot_clocks = trajectory.shot_clock.tolist()
 
-def calculate_passing(time_snapshots, last_possessors, game):
     passing_list = []
-    current_pass = None
-
-    for idx in range(1, len(time_snapshots)):
-        current_possessor = last_possessors[idx]
-        previous_possessor = last_possessors[idx - 1]
-
-        if current_possessor != previous_possessor:
-            # End of the current pass and start of a new pass
-            if current_pass is not None:
-                # Calculate average speed
-                total_speed = sum([get_speed(traj_i["Ball"], traj_j["Ball"])
-                                   for traj_i, traj_j in zip(current_pass["snapshots"][:-1],
-                                                             current_pass["snapshots"][1:])])
-                # Calculate pass duration
-                start_time = time_snapshots[idx - len(current_pass["snapshots"])]["GameClock"]
-                end_time = time_snapshots[idx - 1]["GameClock"]
-                current_pass["pass_duration"] = start_time - end_time
-
-                passing_list.append(current_pass)
-
-            # Start a new pass
-            current_pass = {
-                "pass_from": game.event.player_ids_dict[previous_possessor][
-                    0] if previous_possessor else previous_possessor,
-                "pass_to": game.event.player_ids_dict[current_possessor][0] if current_possessor else current_possessor,
-                "snapshots": [],
-                "GameClock": time_snapshots[idx]["GameClock"],
-                "Quarter": time_snapshots[idx]["Quarter"],
-                "ShotClock": time_snapshots[idx]["ShotClock"],
-                "distance": 0  # This will be updated as trajectory is built
-            }
-
-        # Update the trajectory and distance of the current pass
-        if current_pass is not None:
-            ball_now = time_snapshots[idx]["Ball"]
-            if len(current_pass["snapshots"]) > 0:
-                ball_prev = current_pass["snapshots"][-1]["Ball"]
-                current_pass["distance"] += get_speed(ball_prev, ball_now)
-            current_pass["snapshots"].append(time_snapshots[idx])
-
+    for start, stop, distance in zip(starts.tolist(), stops.tolist(), distances.tolist()):
+        previous_possessor = possessors[start - 1]
+        current_possessor = possessors[start]
+        passing_list.append({
+            "pass_from": player_ids_dict[previous_possessor][0] if previous_possessor else None,
+            "pass_to": player_ids_dict[current_possessor][0] if current_possessor else None,
+            "frames": [start, stop],
+            "GameClock": game_clocks[start],
+            "Quarter": quarters[start],
+            "ShotClock": None if shot_clocks[start] != shot_clocks[start] else shot_clocks[start],
+            "distance": distance,
+            "pass_duration": game_clocks[start] - game_clocks[stop - 1]
+        })
     return passing_list
 
 
-def main():
-    game_name = ".".join(args.path.split('/')[-1].split('.')[:-1])
-    input_event_id = args.event
-    passing_list_list = []
-    event_ids = [input_event_id]
-    if input_event_id == -1:
-        event_ids = [*range(total_events)]
-    visited_events = set()
-    time_snapshots = []
-    for event_id in tqdm(event_ids, desc="Handling events"):
-        game = Game(path_to_json=path, event_index=event_id)
-        hash_value = read_json(game)
-        if hash_value in visited_events:
-            continue
-        visited_events.add(hash_value)
-
-        player_id_to_name_num = game.event.player_ids_dict
-        time_snapshots.extend(reformat_dict(game))
-
-    last_possessors = determine_possessor(time_snapshots, SPEED_THRESHOLD, RADIUS_THRESHOLD)
-    if args.gif:
-        draw_gif(time_snapshots, event_ids, game_name, game)
-
-    passing_list = calculate_passing(time_snapshots, last_possessors, game)
-    # time_to_dict = {(d['Quarter'], d['GameClock']): d for d in time_snapshots}
+def load_session(path, cache=True, cache_dir=GameCache.DEFAULT_DIR):
+    """Returns the GameSession of a game json or .7z archive, parsed once and every event a view into it"""
+    if cache:
+        return GameCache(cache_dir).load(path)
+    print("Uncompressing Basket Ball Event Data")
+    return parse_game(path)
+
+
+def extract_passing(path, event=-1, output_dir='.', save=True, file_format='npz', gif=False, scaling_factor=5,
+                    cache=True, cache_dir=GameCache.DEFAULT_DIR, session=None, workers=1, gif_format='gif'):
+    """Detects the passes of one event of a game, or of all its events when event is -1
+
+    Returns the PassStore of the passes, and the path it was saved to (None when save is False).
+    With workers above 1, possession and passes are detected on chunks of the timeline in a process pool.
+    """
+    if session is None:
+        session = load_session(path, cache, cache_dir)
+    game_name = ".".join(str(path).split('/')[-1].split('.')[:-1])
+    event_ids = [event]
+    if event == -1:
+        event_ids = [*range(len(session))]
+    game = Game(path_to_json=path, event_index=event_ids[-1], session=session)
+    game.read_json()
+
+    # Overlapping events share frames, merge them into one monotonic timeline
+    timeline = session.timeline(event_ids)
+
+    # Possession is detected for every frame of the timeline at once
+    passes = None
+    if workers > 1:
+        possessors, *passes = detect_passes_parallel(timeline.trajectory, game.home_team.id, game.guest_team.id,
+                                                     SPEED_THRESHOLD, RADIUS_THRESHOLD, workers=workers)
+    else:
+        possessors = determine_possessors(timeline.trajectory, game.home_team.id, game.guest_team.id,
+                                          SPEED_THRESHOLD, RADIUS_THRESHOLD)
+    # Single events are named after their index, all events after the game only
+    event_id = f"_Event{event_ids[0]}" if len(event_ids) == 1 else ""
+    if gif:
+        pathlib.Path(output_dir).mkdir(exist_ok=True)
+        gif_path = os.path.join(output_dir, f"{game_name}{event_id}.{gif_format}")
+        draw_gif(timeline.trajectory, possessors, game.home_team.id, game.guest_team.id, gif_path, scaling_factor)
+        print(gif_path, "Saved")
+
+    passing_list = calculate_passing(timeline.trajectory, possessors, game.event.player_ids_dict, passes)
+    store = PassStore(timeline.trajectory, passing_list, game.event.player_ids_dict, game.home_team.id,
+                      game.guest_team.id)
+    if not save:
+        return store, None
+
+    # Save the passing list
+    pathlib.Path(output_dir).mkdir(exist_ok=True)
+    if file_format == 'npz':
+        file_name = os.path.join(output_dir, f"{game_name}{event_id}.npz")
+        print("Saving", file_name, "... To open later, use `PassStore.load(FILE_NAME)`")
+        store.save(file_name)
+        print(file_name, "Saved")
+        return store, file_name
+
+    compressed_file_name = f"{game_name}{event_id}.json.gz"
+    compressed_file_name = os.path.join(output_dir, compressed_file_name)
+    print("Saving", compressed_file_name,
+          "... With compression, this could take a while.\n To open later, use `gzip.open(FILE_NAME, 'wt', encoding='UTF-8')`")
+    with gzip.open(compressed_file_name, 'wt', compresslevel=1, encoding='UTF-8') as json_file:
+        # Snapshots are only built here, from each pass's frame range
+        json.dump([store.to_json()], json_file)
+    print(compressed_file_name, "Saved")
+    return store, compressed_file_name
 
-    passing_list_list.append(passing_list)  # Assuming this is for further usage
 
-    # Save the passing list as JSON
-    if args.save_json:
-        if len(event_ids) == 1:
-            event_id = f"_Event{event_ids[0]}"
-        else:
-            event_id = ""
-        compressed_file_name = f"{game_name}{event_id}.json.gz"
-        compressed_file_name = os.path.join(args.output_dir, compressed_file_name)
-        pathlib.Path(args.output_dir).mkdir(exist_ok=True)
-        print("Saving", compressed_file_name,
-              "... With compression, this could take a while.\n To open later, use `gzip.open(FILE_NAME, 'wt', encoding='UTF-8')`")
-        with gzip.open(compressed_file_name, 'wt', compresslevel=1, encoding='UTF-8') as json_file:
-            json.dump(passing_list_list, json_file)
-        print(compressed_file_name, "Saved")
+def main():
+    parser = argparse.ArgumentParser(description='Generate basketball game animation and passing data.')
+    parser.add_argument('--path', type=str, default="./data/0021500061.json", help='Path to game JSON data.')
+    parser.add_argument('--event', type=int, default=-1, help='Event index to visualize and analyze. -1 for all events')
+    parser.add_argument('--save_json', type=str2bool, default=True, help='Save passing data')
+    parser.add_argument('--format', type=str, default='npz', choices=['npz', 'json'],
+                        help='Passing data format: npz pass table with a trajectory store, or gzip JSON with snapshots')
+    parser.add_argument('--gif', type=str2bool, default=False, help='Draw gifs for the input event')
+    parser.add_argument('--gif_format', type=str, default='gif', choices=['gif', 'mp4'],
+                        help='Animation format: gif written with Pillow, or mp4 written with ffmpeg')
+    parser.add_argument('--scaling_factor', type=int, default=5, help='Scaling factor for ball size in visualization.')
+    parser.add_argument('--output_dir', type=str, default='.', help='Outpuf folder')
+    parser.add_argument('--cache', type=str2bool, default=True, help='Reuse the parsed game from the game cache')
+    parser.add_argument('--cache_dir', type=str, default=GameCache.DEFAULT_DIR, help='Game cache folder')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processes to detect possession with, on chunks of the game timeline')
+    args = parser.parse_args()
+
+    extract_passing(args.path, event=args.event, output_dir=args.output_dir, save=args.save_json,
+                    file_format=args.format, gif=args.gif, scaling_factor=args.scaling_factor, cache=args.cache,
+                    cache_dir=args.cache_dir, workers=args.workers, gif_format=args.gif_format)
 
 
 if __name__ == '__main__':
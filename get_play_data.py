@@ -2,12 +2,14 @@ import argparse
 import gzip
 import os
 import pathlib
-import subprocess
+from bisect import bisect_left
 from collections import defaultdict
+from functools import lru_cache
 
-import pandas as pd
 import ujson as json
-from tqdm import tqdm
+
+from OutcomeIndex import OutcomeIndex
+from PassStore import PassStore
 
 original_data_folder = "./data/2016.NBA.Raw.SportVU.Game.Logs/"
 output_folder = "./data/passing"
@@ -83,108 +85,155 @@ def merge_passes(passes, possession_players):
     return merged_passes
 
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Generate play data from existing passing data.')
-    parser.add_argument('--game_name', type=str, default="01.22.2016.LAC.at.NYK",
-                        help='File name without sffix of the game JSON data. Do not put in path, just the file name')
-    parser.add_argument('--output_all_folder', type=str, default="./data/plays_all/",
-                        help='Folder to output all play data')
-    parser.add_argument('--output_filtered_folder', type=str, default="./data/plays_filtered/",
-                        help='Folder to output filtered play data')
-    args = parser.parse_args()
+@lru_cache(maxsize=None)
+def load_outcome_index(csv_path=espn_csv_path):
+    """Opens the per game index of the ESPN play by play once per process"""
+    return OutcomeIndex.for_csv(csv_path)
 
-    file_name = args.game_name
+
+def load_passing(file_name):
+    """Returns the passes of a game as a list of event pass lists, extracting them first if needed"""
     compressed_path = f"{original_data_folder}{file_name}.7z"
     os.makedirs(os.path.dirname(output_folder), exist_ok=True)
 
-    pass_path = os.path.join(output_folder, file_name + '.json.gz')
-    if not os.path.exists(pass_path):
-        print("Parsing Passing Data from", pass_path)
-        subprocess.run(["python", "get_passing_data.py", "--path", compressed_path, "--output_dir",
-                        output_folder])
+    pass_path = os.path.join(output_folder, file_name + '.npz')
+    json_pass_path = os.path.join(output_folder, file_name + '.json.gz')
+    if not os.path.exists(pass_path) and not os.path.exists(json_pass_path):
+        from get_passing_data import extract_passing
+
+        print("Parsing Passing Data from", compressed_path)
+        extract_passing(compressed_path, output_dir=output_folder)
 
-    with gzip.open(pass_path, 'rt', encoding='UTF-8') as file:
+    if os.path.exists(pass_path):
         print("Loading from parsed passing data:", pass_path)
-        passing = json.load(file)
-    print("Reading espn data from", espn_csv_path)
-    espn_data = pd.read_csv(espn_csv_path, compression='gzip')
-    this_game_espn_data = espn_data[espn_data['Game'] == reformat_date_team(file_name)]
+        store = PassStore.load(pass_path)
+        # Only the passes that can be aligned get their snapshots built
+        return [[store.materialize(one_pass) for one_pass in store.passes if one_pass['pass_duration'] > 0]]
+    with gzip.open(json_pass_path, 'rt', encoding='UTF-8') as file:
+        print("Loading from parsed passing data:", json_pass_path)
+        return json.load(file)
 
+
+def get_espn_events(file_name, outcome_index):
     # (Quarter, SecLeft) to {Outcome, Weight}
-    espn_quarter_secleft_to_event = this_game_espn_data[['Quarter', 'SecLeft', 'Outcome', 'Weight']].groupby(
-        ['Quarter', 'SecLeft']).last().to_dict(orient='index')
-    # Sort in that starts from (1, 720) to (1, ~0) to (2, 720)... eventually (4, ~0)
-    espn_quarter_secleft_to_event = {k: espn_quarter_secleft_to_event[k] for k in
-                                     sorted(espn_quarter_secleft_to_event, key=lambda x: (x[0], -x[1]))}
+    # Sorted in that starts from (1, 720) to (1, ~0) to (2, 720)... eventually (4, ~0)
+    return outcome_index.events(reformat_date_team(file_name))
+
+
+def split_quarters(espn_quarter_secleft_to_event):
+    """Quarter to the SecLeft of its ESPN events and the events, in game order"""
+    quarters = defaultdict(lambda: ([], []))
+    for (quarter_id, sec_left), espn_event in espn_quarter_secleft_to_event.items():
+        quarters[quarter_id][0].append(sec_left)
+        quarters[quarter_id][1].append(espn_event)
+    return quarters
+
+
+def combine_play(play):
+    home_players = set([*play['Passes'][0]['snapshots'][0]['HomePlayers'].keys()])
+    away_players = set([*play['Passes'][0]['snapshots'][0]['GuestPlayers'].keys()])
+    if ([pas['pass_to'] in home_players for pas in play['Passes'] if pas['pass_to']] + [
+            play['Passes'][0]['pass_from'] in home_players]).count(True) >= len(play['Passes']) // 2:
+        possession_players = home_players
+    else:
+        possession_players = away_players
+    play['CombinedPasses'] = merge_passes(play['Passes'], possession_players)
+    if play['CombinedPasses'] is None:
+        del play['CombinedPasses']
+
+
+def align_plays(passing, espn_quarter_secleft_to_event):
+    """Groups the passes into the plays between consecutive ESPN events, keyed by (quarter, play id)
+
+    Play i of a quarter runs from its ESPN event i to event i + 1 and takes
+    the passes, in game order, until the first one that is before event i + 1.
+    Passes and plays are walked once each, with a binary search to skip the
+    plays without passes. A pass that fits no play of its quarter holds up
+    all later passes, as it always did.
+    """
     # (Quarter, SecLeft) to {'pass_from', 'pass_to', 'snapshots', 'GameClock', 'Quarter', 'ShotClock', 'distance', 'average_speed', 'pass_duration'}
     # Sorted in that starts from (1, 720) to (1, ~0) to (2, 720)... eventually (4, ~0)
     # Where `snapshots` is a list of {'Ball', 'HomePlayers', 'GuestPlayers', 'GameClock', 'Quarter', 'ShotClock'}
     passing_quarter_secleft_to_event = {(one_pass['Quarter'], one_pass['GameClock']): one_pass for event in passing for
                                         one_pass in event if one_pass['pass_duration'] > 0}
+    pass_keys = list(passing_quarter_secleft_to_event)
+    passes = list(passing_quarter_secleft_to_event.values())
+    quarters = split_quarters(espn_quarter_secleft_to_event)
 
     final_result = defaultdict(dict)
-
-    for quarter_id in tqdm(range(1, 5), desc="Processing Quarters"):
+    next_pass = 0
+    for quarter_id in range(1, 5):
+        espn_seclefts, espn_events = quarters[quarter_id]
+        # Ascending, for bisect
+        negated_seclefts = [-sec_left for sec_left in espn_seclefts]
         play_id = 0
-        espn_secleft_to_event = {k[1]: v for k, v in espn_quarter_secleft_to_event.items() if k[0] == quarter_id}
-        espn_seclefts = list(espn_secleft_to_event.keys())
-        while play_id < len(espn_secleft_to_event) - 1:
-            sec_left = espn_seclefts[play_id]
-            next_sec_left = espn_seclefts[play_id + 1]
-            if not passing_quarter_secleft_to_event:
-                break
-            current_pass_key = list(passing_quarter_secleft_to_event.keys())[0]
-
-            while current_pass_key[0] == quarter_id and current_pass_key[1] >= espn_seclefts[play_id + 1]:
-                if "Weight" not in final_result[(quarter_id, play_id)]:
-                    final_result[(quarter_id, play_id)]["Weight"] = espn_secleft_to_event[next_sec_left]['Weight']
-                if "Outcome" not in final_result[(quarter_id, play_id)]:
-                    final_result[(quarter_id, play_id)]['Outcome'] = espn_secleft_to_event[next_sec_left]['Outcome']
-                if "SecLeft_From" not in final_result[(quarter_id, play_id)]:
-                    final_result[(quarter_id, play_id)]["SecLeft_From"] = espn_seclefts[play_id]
-                if "SecLeft_Until" not in final_result[(quarter_id, play_id)]:
-                    final_result[(quarter_id, play_id)]["SecLeft_Until"] = espn_seclefts[play_id + 1]
-                if "Quarter" not in final_result[(quarter_id, play_id)]:
-                    final_result[(quarter_id, play_id)]['Quarter'] = quarter_id
-                if "Passes" not in final_result[(quarter_id, play_id)]:
-                    final_result[(quarter_id, play_id)]['Passes'] = []
-
-                final_result[(quarter_id, play_id)]['Passes'].append(
-                    passing_quarter_secleft_to_event.pop(current_pass_key))
-                if not passing_quarter_secleft_to_event:
-                    break
-                current_pass_key = list(passing_quarter_secleft_to_event.keys())[0]
-            if (quarter_id, play_id) in final_result and final_result[(quarter_id, play_id)]['Passes']:
-                new_passes = []
-                home_players = set(
-                    [*final_result[(quarter_id, play_id)]['Passes'][0]['snapshots'][0]['HomePlayers'].keys()])
-                away_players = set(
-                    [*final_result[(quarter_id, play_id)]['Passes'][0]['snapshots'][0]['GuestPlayers'].keys()])
-                if ([pas['pass_to'] in home_players for pas in
-                     final_result[(quarter_id, play_id)]['Passes'] if pas['pass_to']] + [
-                        final_result[(quarter_id, play_id)]['Passes'][0]['pass_from'] in home_players]).count(
-                    True) >= len(
-                    final_result[(quarter_id, play_id)]['Passes']) // 2:
-                    possession_players = home_players
-                else:
-                    possession_players = away_players
-                final_result[(quarter_id, play_id)]['CombinedPasses'] = (
-                    merge_passes(final_result[(quarter_id, play_id)]['Passes'], possession_players))
-                if final_result[(quarter_id, play_id)]['CombinedPasses'] is None:
-                    del final_result[(quarter_id, play_id)]['CombinedPasses']
+        while (play_id < len(espn_seclefts) - 1 and next_pass < len(passes)
+               and pass_keys[next_pass][0] == quarter_id):
+            sec_left = pass_keys[next_pass][1]
+            if sec_left < espn_seclefts[play_id + 1]:
+                # Skip to the first play that ends at or before this pass
+                play_id = bisect_left(negated_seclefts, -sec_left, lo=play_id + 1) - 1
+                continue
+            play_passes = []
+            while (next_pass < len(passes) and pass_keys[next_pass][0] == quarter_id
+                   and pass_keys[next_pass][1] >= espn_seclefts[play_id + 1]):
+                play_passes.append(passes[next_pass])
+                next_pass += 1
+            final_result[(quarter_id, play_id)] = play = {
+                "Weight": espn_events[play_id + 1]['Weight'],
+                "Outcome": espn_events[play_id + 1]['Outcome'],
+                "SecLeft_From": espn_seclefts[play_id],
+                "SecLeft_Until": espn_seclefts[play_id + 1],
+                "Quarter": quarter_id,
+                "Passes": play_passes,
+            }
+            combine_play(play)
             play_id += 1
+    return final_result
+
+
+def filter_plays(final_result):
+    return [play for idx, play in final_result.items() if
+            play['Outcome'].split(" ")[1] in (
+                    str(play["Passes"][-1]['pass_from']) + str(
+                play["Passes"][-1]['pass_to'])) and "CombinedPasses" in play]
+
+
+def build_plays(file_name, output_all_folder="./data/plays_all/", output_filtered_folder="./data/plays_filtered/",
+                outcome_index=None):
+    """Aligns the passes of a game with its ESPN play by play and saves all and filtered plays
+
+    Runs in process, passing data is extracted first if it does not exist yet.
+    """
+    passing = load_passing(file_name)
+    if outcome_index is None:
+        outcome_index = load_outcome_index()
+    final_result = align_plays(passing, get_espn_events(file_name, outcome_index))
 
     plays = [*final_result.values()]
-    filtered_plays = [play for idx, play in final_result.items() if
-                      play['Outcome'].split(" ")[1] in (
-                              str(play["Passes"][-1]['pass_from']) + str(
-                          play["Passes"][-1]['pass_to'])) and "CombinedPasses" in play]
-    pathlib.Path(args.output_all_folder).mkdir(exist_ok=True)
-    pathlib.Path(args.output_filtered_folder).mkdir(exist_ok=True)
+    filtered_plays = filter_plays(final_result)
+    pathlib.Path(output_all_folder).mkdir(exist_ok=True)
+    pathlib.Path(output_filtered_folder).mkdir(exist_ok=True)
     print("Saving results")
     print("all: len=", len(plays))
-    json.dump(plays, open(os.path.join(args.output_all_folder, file_name + ".json"), "w+"))
+    with open(os.path.join(output_all_folder, file_name + ".json"), "w+") as file:
+        json.dump(plays, file)
     print("filtered: len=", len(filtered_plays))
-    json.dump(filtered_plays, open(os.path.join(args.output_filtered_folder, file_name + ".json"), "w+"))
-    print("Saved to ", os.path.join(args.output_all_folder, file_name + ".json"))
-    print("Saved to ", os.path.join(args.output_filtered_folder, file_name + ".json"))
+    with open(os.path.join(output_filtered_folder, file_name + ".json"), "w+") as file:
+        json.dump(filtered_plays, file)
+    print("Saved to ", os.path.join(output_all_folder, file_name + ".json"))
+    print("Saved to ", os.path.join(output_filtered_folder, file_name + ".json"))
+    return plays, filtered_plays
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate play data from existing passing data.')
+    parser.add_argument('--game_name', type=str, default="01.22.2016.LAC.at.NYK",
+                        help='File name without sffix of the game JSON data. Do not put in path, just the file name')
+    parser.add_argument('--output_all_folder', type=str, default="./data/plays_all/",
+                        help='Folder to output all play data')
+    parser.add_argument('--output_filtered_folder', type=str, default="./data/plays_filtered/",
+                        help='Folder to output filtered play data')
+    args = parser.parse_args()
+
+    build_plays(args.game_name, args.output_all_folder, args.output_filtered_folder)
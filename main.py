@@ -1,21 +1,44 @@
 import argparse
 
+from Event import FPS
 from Game import Game
+from GameSession import GameSession
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Process arguments about an NBA game.')
     parser.add_argument('--path', type=str,
                         help='a path to json file to read the events from',
                         required=True)
-    parser.add_argument('--event', type=int, default=0,
+    parser.add_argument('--event', type=int, nargs='+', default=[0],
                         help="""an index of the event to create the animation to
                                 (the indexing start with zero, if you index goes beyond out
                                 the total number of events (plays), it will show you the last
-                                one of the game)""")
+                                one of the game), several indices export several events""")
+    parser.add_argument('--output', type=str, default=None,
+                        help="""a file to write the animation to instead of showing it, no display
+                                is needed (.gif is written with Pillow, other formats with ffmpeg),
+                                {event} in the name is replaced by the index of the event""")
+    parser.add_argument('--fps', type=int, default=FPS, help='frames per second of the written animation')
+    parser.add_argument('--renderer', type=str, default='matplotlib', choices=['matplotlib', 'raster'],
+                        help='how to draw the written animation, raster is much faster but has no roster table')
 
     args = parser.parse_args()
 
-    game = Game(path_to_json=args.path, event_index=args.event)
+    if args.output is not None:
+        if len(args.event) > 1 and '{event}' not in args.output:
+            parser.error('--output needs {event} in its name to export several events')
+        # The game is parsed once for all the events to export
+        session = GameSession.from_json(args.path) if len(args.event) > 1 else None
+        for event_index in args.event:
+            game = Game(path_to_json=args.path, event_index=event_index, session=session)
+            game.read_json()
+            print('Wrote', game.save(args.output.format(event=event_index), fps=args.fps,
+                                        renderer=args.renderer))
+        parser.exit()
+    elif len(args.event) > 1:
+        parser.error('only one --event can be shown, use --output to export several')
+
+    game = Game(path_to_json=args.path, event_index=args.event[0])
     game.read_json()
     #
     #
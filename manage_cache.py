@@ -0,0 +1,33 @@
+import argparse
+import glob
+import os
+
+from tqdm import tqdm
+
+from GameCache import GameCache
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Warm or clear the cache of parsed SportVU games.')
+    parser.add_argument('command', choices=['warm', 'clear', 'list'],
+                        help='warm: parse and cache every archive in --dir, clear: delete every cached game, '
+                             'list: show the cached games')
+    parser.add_argument('--dir', type=str, default='./data/2016.NBA.Raw.SportVU.Game.Logs/',
+                        help='Folder with the .7z game archives to warm the cache with')
+    parser.add_argument('--cache_dir', type=str, default=GameCache.DEFAULT_DIR, help='Cache folder')
+    parser.add_argument('--max_gb', type=float, default=GameCache.DEFAULT_MAX_BYTES / 1024 ** 3,
+                        help='Size cap of the cache, least recently used games are evicted past it')
+    args = parser.parse_args()
+
+    cache = GameCache(args.cache_dir, max_bytes=int(args.max_gb * 1024 ** 3))
+    if args.command == 'clear':
+        cache.clear()
+        print("Cleared", args.cache_dir)
+    elif args.command == 'list':
+        for last_use, size, entry_path in cache.entries():
+            print(f"{os.path.basename(entry_path)}  {size / 1024 ** 2:8.1f} MB")
+    else:
+        for archive_path in tqdm(sorted(glob.glob(os.path.join(args.dir, '*.7z'))), desc="Warming cache"):
+            try:
+                cache.load(archive_path)
+            except Exception as e:
+                print("Skipping", archive_path, "-", e)
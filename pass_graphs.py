@@ -0,0 +1,213 @@
+import numpy as np
+
+# Metrics of create_graphs.ipynb, attacking ones per possession and defensive ones per pass
+ATTACKING_METRICS = ['max_bwn_c', 'recip', 'triangles', 'numpasses']
+DEFENSIVE_METRICS = ['def_max_pagerank', 'def_dist_from_ball', 'def_edge_sum']
+# Graphs of a stack are processed in chunks of this many, the path tensors grow with nodes cubed
+CHUNK_GRAPHS = 2048
+
+
+def attacking_graphs(possessions, key='CombinedPasses'):
+    """Stacks the directed pass graphs of the possessions as (possessions, nodes, nodes) pass counts
+
+    Returns the weights and the node count of every graph, nodes past a
+    graph's count are padding. Passes from or to nobody go to the nodes 'x'
+    and 'y', and self passes are dropped, like compute_attacking_graph.
+    """
+    edge_lists = []
+    for possession in possessions:
+        nodes = {}
+        edges = []
+        for one_pass in possession[key]:
+            pass_from = one_pass['pass_from'] or 'x'
+            pass_to = one_pass['pass_to'] or 'y'
+            # No self-loops
+            if pass_from == pass_to:
+                continue
+            edges.append((nodes.setdefault(pass_from, len(nodes)), nodes.setdefault(pass_to, len(nodes))))
+        edge_lists.append((len(nodes), edges))
+
+    node_counts = np.array([count for count, _ in edge_lists], dtype=np.int64)
+    size = int(node_counts.max(initial=0))
+    weights = np.zeros((len(edge_lists), size, size), dtype=np.int64)
+    graph_index = np.repeat(np.arange(len(edge_lists)), [len(edges) for _, edges in edge_lists])
+    edges = np.array([edge for _, edges in edge_lists for edge in edges], dtype=np.int64).reshape(-1, 2)
+    np.add.at(weights, (graph_index, edges[:, 0], edges[:, 1]), 1)
+    return weights, node_counts
+
+
+def shortest_paths(adjacency):
+    """Hop distances (inf when unreachable) and shortest path counts between all nodes of a graph stack"""
+    graphs, size = adjacency.shape[:2]
+    adjacency = adjacency.astype(np.float64)
+    distances = np.full((graphs, size, size), np.inf)
+    distances[:, np.arange(size), np.arange(size)] = 0
+    counts = np.broadcast_to(np.eye(size), (graphs, size, size)).copy()
+    walks = counts.copy()
+    # The walks of the shortest length between two nodes are exactly their shortest paths
+    for length in range(1, size):
+        walks = walks @ adjacency
+        reached = (walks > 0) & np.isinf(distances)
+        if not reached.any():
+            break
+        distances[reached] = length
+        counts[reached] = walks[reached]
+    return distances, counts
+
+
+def betweenness_centrality(adjacency, node_counts):
+    """nx.betweenness_centrality of every node of a stack of unweighted directed graphs, normalized
+
+    Returns (graphs, nodes), 0 for padding nodes.
+    """
+    graphs, size = adjacency.shape[:2]
+    centrality = np.zeros((graphs, size))
+    for start in range(0, graphs, CHUNK_GRAPHS):
+        distances, counts = shortest_paths(adjacency[start:start + CHUNK_GRAPHS])
+        # [graph, s, v, t]: v lies on the shortest paths from s to t
+        through = distances[:, :, :, None] + distances[:, None, :, :] == distances[:, :, None, :]
+        through &= np.isfinite(distances)[:, :, None, :]
+        distinct = ~np.eye(size, dtype=bool)
+        through &= distinct[:, :, None] & distinct[None, :, :] & distinct[:, None, :]
+        pairs = counts[:, :, None, :]
+        share = np.divide(counts[:, :, :, None] * counts[:, None, :, :], pairs, out=np.zeros(through.shape),
+                          where=through)
+        centrality[start:start + CHUNK_GRAPHS] = share.sum(axis=(1, 3))
+    # Graphs of up to two nodes are not rescaled
+    scale = np.where(node_counts > 2, 1 / np.maximum((node_counts - 1) * (node_counts - 2), 1), 1)
+    return centrality * scale[:, None]
+
+
+def reciprocity(adjacency):
+    """nx.reciprocity of every graph of a stack of directed graphs without self loops, NaN without edges"""
+    edges = adjacency.sum(axis=(1, 2))
+    mutual = (adjacency & adjacency.transpose(0, 2, 1)).sum(axis=(1, 2))
+    return np.divide(mutual, edges, out=np.full(len(adjacency), np.nan), where=edges > 0)
+
+
+def triangles(adjacency):
+    """Triangles of every graph of a stack, with edge directions ignored"""
+    undirected = (adjacency | adjacency.transpose(0, 2, 1)).astype(np.int64)
+    return np.einsum('gij,gjk,gki->g', undirected, undirected, undirected) // 6
+
+
+def attacking_metrics(weights, node_counts):
+    """ATTACKING_METRICS of a stack of attacking graphs, NaN where networkx fails on an empty graph"""
+    adjacency = weights > 0
+    centrality = betweenness_centrality(adjacency, node_counts)
+    return {
+        'max_bwn_c': np.where(node_counts > 0, centrality.max(axis=1, initial=0), np.nan),
+        'recip': reciprocity(adjacency),
+        'triangles': triangles(adjacency).astype(np.float64),
+        # sum of all edge weights (number of passes)
+        'numpasses': weights.sum(axis=(1, 2)).astype(np.float64),
+    }
+
+
+def defending_team(possession):
+    """'home' or 'guest' for the team that received the fewest passes, 'unknown' when it is unclear
+
+    The same majority vote as compute_defending_team_for_possession.
+    """
+    counts = {}
+    for one_pass in possession['CombinedPasses']:
+        snapshot = one_pass['snapshots'][0]
+        pass_to = one_pass['pass_to']
+        if pass_to in snapshot['HomePlayers']:
+            team = 'home'
+        elif pass_to in snapshot['GuestPlayers']:
+            team = 'guest'
+        else:
+            team = 'unknown'
+        counts[team] = counts.get(team, 0) + 1
+    # Sanity check: if this possession had equal-ish passees from both teams, then something is wrong
+    if abs(counts.get('home', 0) - counts.get('guest', 0)) <= 2:
+        return 'unknown'
+    # The least frequent receiving team, ties go to the one seen first
+    return min(counts, key=counts.get)
+
+
+def defensive_graphs(possessions, teams):
+    """Stacks the distance graphs of the defending team at the start of every pass as (graphs, nodes, nodes)
+
+    Node 0 is the ball and nodes 1 to the node count are the defenders,
+    every distance is rounded to 2 decimals like
+    create_defensive_graphs_for_possession. Possessions whose team is
+    'unknown' have no graphs. Returns the distances, the node count of every
+    graph and the index of the possession it belongs to.
+    """
+    positions = []
+    owners = []
+    for index, (possession, team) in enumerate(zip(possessions, teams)):
+        if team == 'unknown':
+            continue
+        players_key = 'HomePlayers' if team == 'home' else 'GuestPlayers'
+        for one_pass in possession['CombinedPasses']:
+            snapshot = one_pass['snapshots'][0]
+            ball = snapshot['Ball']
+            positions.append([(ball['x'], ball['y'])] +
+                             [(player['x'], player['y']) for player in snapshot[players_key].values()])
+            owners.append(index)
+
+    node_counts = np.array([len(nodes) for nodes in positions], dtype=np.int64)
+    size = int(node_counts.max(initial=0))
+    stacked = np.full((len(positions), size, 2), np.nan)
+    for graph, nodes in enumerate(positions):
+        stacked[graph, :len(nodes)] = nodes
+    x = stacked[:, :, 0]
+    y = stacked[:, :, 1]
+    distances = np.round(np.sqrt((x[:, :, None] - x[:, None, :]) ** 2 + (y[:, :, None] - y[:, None, :]) ** 2), 2)
+    return distances, node_counts, np.array(owners, dtype=np.int64)
+
+
+def pagerank(weights, node_counts, alpha=0.85, max_iter=100, tol=1.0e-06):
+    """nx.pagerank of every node of a stack of weighted graphs, by its power iteration on all graphs at once
+
+    Every graph stops iterating when networkx's convergence test passes for
+    it. Returns (graphs, nodes), 0 for padding nodes and NaN for graphs that
+    do not converge, where networkx raises.
+    """
+    graphs, size = weights.shape[:2]
+    real = np.arange(size) < node_counts[:, None]
+    weights = np.where(real[:, :, None] & real[:, None, :], weights, 0)
+    out_weights = weights.sum(axis=2)
+    inverse = np.divide(1.0, out_weights, out=np.zeros_like(out_weights, dtype=np.float64), where=out_weights != 0)
+    transition = inverse[:, :, None] * weights
+    dangling = real & (out_weights == 0)
+    personalization = np.where(real, 1.0 / np.maximum(node_counts, 1)[:, None], 0)
+
+    ranks = personalization.copy()
+    active = np.flatnonzero(node_counts > 0)
+    for _ in range(max_iter):
+        if not len(active):
+            break
+        x = ranks[active]
+        p = personalization[active]
+        x_next = alpha * (np.einsum('gi,gij->gj', x, transition[active]) +
+                          (x * dangling[active]).sum(axis=1, keepdims=True) * p) + (1 - alpha) * p
+        ranks[active] = x_next
+        # check convergence, l1 norm
+        converged = np.abs(x_next - x).sum(axis=1) < node_counts[active] * tol
+        active = active[~converged]
+    ranks[active] = np.nan
+    return ranks
+
+
+def defensive_metrics(distances, node_counts):
+    """DEFENSIVE_METRICS of a stack of defensive graphs, NaN where networkx fails on a graph without defenders"""
+    if distances.shape[1] == 0:
+        # A stack without any node, one padding node keeps the ball row below in bounds
+        distances = np.zeros((len(distances), 1, 1))
+    size = distances.shape[1]
+    real = np.arange(size) < node_counts[:, None]
+    pairs = real[:, :, None] & real[:, None, :] & np.triu(np.ones((size, size), dtype=bool), k=1)
+    ball_distances = np.where(real[:, 1:], distances[:, 0, 1:], 0).sum(axis=1)
+    defenders = node_counts - 1
+    max_pagerank = np.where(real, pagerank(distances, node_counts), -np.inf).max(axis=1, initial=-np.inf)
+    return {
+        'def_max_pagerank': np.where(node_counts > 0, max_pagerank, np.nan),
+        'def_dist_from_ball': np.divide(ball_distances, defenders, out=np.full(len(distances), np.nan),
+                                        where=defenders > 0),
+        # sum of all edge weights
+        'def_edge_sum': np.where(pairs, distances, 0).sum(axis=(1, 2)),
+    }
@@ -0,0 +1,190 @@
+import numpy as np
+
+# Possessor id used before anybody had the ball, 0 is also the id of an empty player slot
+NO_POSSESSOR = 0
+
+
+def get_speeds(trajectory):
+    """Distance the ball travelled since the previous frame, NaN for the first frame"""
+    ball = trajectory.ball
+    speeds = np.full(len(trajectory), np.nan)
+    speeds[1:] = np.sqrt((ball[1:, 0] - ball[:-1, 0]) ** 2 + (ball[1:, 1] - ball[:-1, 1]) ** 2)
+    return speeds
+
+
+def get_nearest_players(trajectory, team_id):
+    """Player slot nearest to the ball for every frame, and its distance (inf when the team is empty)"""
+    ball = trajectory.ball
+    players = trajectory.players
+    distances = np.sqrt((players[:, :, 0] - ball[:, None, 0]) ** 2 + (players[:, :, 1] - ball[:, None, 1]) ** 2)
+    distances[trajectory.team_ids[:, 1:] != team_id] = np.inf
+    # argmin returns the first of equally near players, like the per frame search did
+    nearest = np.argmin(distances, axis=1)
+    return nearest, distances[np.arange(len(trajectory)), nearest]
+
+
+def gate_possessors(trajectory, home_team_id, guest_team_id, speed_threshold, radius_threshold):
+    """Returns which frames name a new possessor, and the player id every frame would name
+
+    The speed of the first frame is unknown, so it is never gated. Pass the
+    previous frame too and drop it from the result to gate a chunk that does
+    not start the timeline.
+    """
+    frames = len(trajectory)
+    home_nearest, home_distances = get_nearest_players(trajectory, home_team_id)
+    guest_nearest, guest_distances = get_nearest_players(trajectory, guest_team_id)
+    with np.errstate(invalid='ignore'):
+        gated = (get_speeds(trajectory) < speed_threshold) & (trajectory.ball[:, 2] < radius_threshold)
+    gated &= np.isfinite(home_distances) & np.isfinite(guest_distances)
+
+    slots = np.where(home_distances < guest_distances, home_nearest, guest_nearest)
+    candidates = trajectory.player_ids[np.arange(frames), slots + 1]
+    return gated, candidates
+
+
+def fill_possessors(gated, candidates):
+    """Carries the candidate of the last gated frame forward, NO_POSSESSOR before the first one"""
+    frames = len(gated)
+    last_gated = np.maximum.accumulate(np.where(gated, np.arange(frames), -1))
+    return np.where(last_gated >= 0, candidates[np.maximum(last_gated, 0)], NO_POSSESSOR)
+
+
+def determine_possessors(trajectory, home_team_id, guest_team_id, speed_threshold, radius_threshold):
+    """Returns the last possessor's player id for every frame
+
+    A frame names a new possessor when the ball is slow and low enough and
+    both teams are on the court: it goes to the nearest home player if it is
+    strictly nearer than the nearest guest player, else to the nearest guest
+    player. Other frames keep the previous possessor.
+    """
+    if len(trajectory) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return fill_possessors(*gate_possessors(trajectory, home_team_id, guest_team_id, speed_threshold,
+                                            radius_threshold))
+
+
+# Trajectory of the shared memory block a pool worker attached to
+_shared = None
+
+
+def _attach(spec):
+    global _shared
+    from SharedTrajectory import SharedTrajectory
+
+    _shared = SharedTrajectory.attach(spec)
+
+
+def _segment_chunk(args):
+    """Detects possession and passes on frames [start, stop) of the shared trajectory, in a pool worker
+
+    The possessor carried in from earlier chunks is unknown here, so frames
+    before the chunk's first gated frame are left to the parent. Returns the
+    possessor changes from that frame on, the first gated frame always
+    included, with the running ball distance and count of frames without a
+    ball since the chunk's start at every change and at the frame before it.
+    """
+    start, stop, home_team_id, guest_team_id, speed_threshold, radius_threshold = args
+    # One frame of overlap, the speed at start needs the ball of the frame before
+    overlap = 1 if start > 0 else 0
+    chunk = _shared[1][start - overlap:stop]
+    gated, candidates = gate_possessors(chunk, home_team_id, guest_team_id, speed_threshold, radius_threshold)
+    gated, candidates = gated[overlap:], candidates[overlap:]
+    speeds = get_speeds(chunk)[overlap:]
+    missing = np.isnan(speeds)
+    # The speed of the first frame of the timeline is unknown but not missing, like in get_pass_distances
+    missing[:1 - overlap] = False
+    # Prepended 0 is the frame before the chunk
+    sums = np.concatenate([[0], np.cumsum(np.where(np.isnan(speeds), 0, speeds))])
+    missing = np.concatenate([[0], np.cumsum(missing)])
+
+    gated_frames = np.flatnonzero(gated)
+    if not len(gated_frames):
+        changes = np.zeros(0, dtype=np.int64)
+        possessors = np.zeros(0, dtype=np.int64)
+    else:
+        first = gated_frames[0]
+        possessors = fill_possessors(gated[first:], candidates[first:])
+        changes = np.concatenate([[0], np.flatnonzero(possessors[1:] != possessors[:-1]) + 1])
+        possessors = possessors[changes]
+        changes = changes + first
+    return (start, changes + start, possessors, sums[changes + 1], sums[changes], missing[changes + 1],
+            missing[changes], sums[-1], missing[-1])
+
+
+def detect_passes_parallel(trajectory, home_team_id, guest_team_id, speed_threshold, radius_threshold, workers=None,
+                           chunk_frames=25000):
+    """determine_possessors, segment_passes and get_pass_distances with the frames split into chunks
+
+    Chunks are processed in a process pool reading one shared memory copy of
+    the trajectory. Stitching the chunks in order carries the possessor over
+    chunk edges, drops the first change of a chunk when it names the
+    possessor carried in, and adds the running distances of earlier chunks,
+    so passes that cross chunk edges come out whole. Returns the possessor
+    of every frame, and the starts, stops and distances of the passes.
+    """
+    import multiprocessing as mp
+
+    from SharedTrajectory import SharedTrajectory
+
+    frames = len(trajectory)
+    chunks = [(start, min(start + chunk_frames, frames), home_team_id, guest_team_id, speed_threshold,
+               radius_threshold) for start in range(0, frames, chunk_frames)]
+    results = []
+    if chunks:
+        with SharedTrajectory(trajectory) as shared:
+            with mp.Pool(min(workers or mp.cpu_count(), len(chunks)), initializer=_attach,
+                         initargs=(shared.spec,)) as pool:
+                results = sorted(pool.imap_unordered(_segment_chunk, chunks), key=lambda result: result[0])
+
+    carried = NO_POSSESSOR
+    offset_sum = 0.0
+    offset_missing = 0
+    stitched = [[] for _ in range(6)]
+    for _, changes, possessors, sums, previous_sums, missing, previous_missing, total_sum, total_missing in results:
+        if len(changes):
+            keep = np.ones(len(changes), dtype=bool)
+            keep[0] = possessors[0] != carried
+            for values, chunk_values in zip(stitched, (changes, possessors, offset_sum + sums,
+                                                       offset_sum + previous_sums, offset_missing + missing,
+                                                       offset_missing + previous_missing)):
+                values.append(chunk_values[keep])
+            carried = possessors[-1]
+        offset_sum += total_sum
+        offset_missing += total_missing
+    changes, possessors, sums, previous_sums, missing, previous_missing = (
+        np.concatenate(values) if values else np.zeros(0) for values in stitched)
+    changes = changes.astype(np.int64)
+
+    frame_possessors = np.repeat(np.concatenate([[NO_POSSESSOR], possessors]).astype(np.int64),
+                                 np.diff(np.concatenate([[0], changes, [frames]])))
+    # A pass runs from one change to the next, like segment_passes
+    starts, stops = changes[:-1], changes[1:]
+    distances = previous_sums[1:] - sums[:-1]
+    distances[previous_missing[1:] != missing[:-1]] = np.nan
+    return frame_possessors, starts, stops, distances
+
+
+def segment_passes(possessors):
+    """Returns the start and stop frames of every possession run that ends with a possessor change
+
+    Run i covers frames starts[i] to stops[i] - 1, it was passed from
+    possessors[starts[i] - 1] to possessors[starts[i]]. The run still going on
+    at the last frame has no end and is left out.
+    """
+    changes = np.flatnonzero(possessors[1:] != possessors[:-1]) + 1
+    return changes[:-1], changes[1:]
+
+
+def get_pass_distances(trajectory, starts, stops):
+    """Distance the ball travelled within every [start, stop) frame range, 0 for a single frame"""
+    speeds = get_speeds(trajectory)
+    missing = np.isnan(speeds)
+    missing[:1] = False
+    cumulative_speeds = np.cumsum(np.where(np.isnan(speeds), 0, speeds))
+    cumulative_missing = np.cumsum(missing)
+    distances = cumulative_speeds[stops - 1] - cumulative_speeds[starts]
+    # A frame without a ball position makes the whole pass distance unknown
+    distances[cumulative_missing[stops - 1] != cumulative_missing[starts]] = np.nan
+    # The ball cannot travel within a single frame
+    distances[stops - starts <= 1] = 0
+    return distances
@@ -0,0 +1,167 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import tempfile
+import time
+from glob import glob
+
+import numpy as np
+
+from pass_graphs import (ATTACKING_METRICS, DEFENSIVE_METRICS, attacking_graphs, attacking_metrics, defending_team,
+                         defensive_graphs, defensive_metrics)
+
+MIN_PASSES_IN_POSSESSION = 3
+# Defensive metrics are taken at the first, middle and last pass of a possession
+FEATURE_COLUMNS = ATTACKING_METRICS + [f'{label}_{i}' for i in range(3) for label in DEFENSIVE_METRICS]
+
+
+def game_features(possessions, min_passes=MIN_PASSES_IN_POSSESSION):
+    """Feature columns of the possessions of one game, the rows of create_graphs.ipynb
+
+    Possessions with fewer than min_passes passes or an unclear defending
+    team are left out. Returns a dict of equally long arrays: 'play', the
+    index of the possession in the game, FEATURE_COLUMNS and 'label', the
+    possession's Weight.
+    """
+    weights, node_counts = attacking_graphs(possessions)
+    attacking = attacking_metrics(weights, node_counts)
+    teams = [defending_team(possession) if passes >= min_passes else 'unknown'
+             for possession, passes in zip(possessions, attacking['numpasses'].tolist())]
+    plays = np.flatnonzero([team != 'unknown' for team in teams])
+    distances, graph_node_counts, owners = defensive_graphs(possessions, teams)
+    defensive = defensive_metrics(distances, graph_node_counts)
+
+    # The graphs of a possession are contiguous in owners
+    starts = np.searchsorted(owners, plays)
+    lengths = np.searchsorted(owners, plays, side='right') - starts
+    columns = {'play': plays}
+    for label in ATTACKING_METRICS:
+        columns[label] = attacking[label][plays]
+    for i, graphs in enumerate((starts, starts + lengths // 2, starts + lengths - 1)):
+        for label in DEFENSIVE_METRICS:
+            columns[f'{label}_{i}'] = defensive[label][graphs]
+    columns['label'] = np.array([possessions[play]['Weight'] for play in plays.tolist()], dtype=np.float64)
+    return columns
+
+
+def cache_path_of(plays_path, cache_dir):
+    return os.path.join(cache_dir, os.path.basename(plays_path).rsplit('.', 1)[0] + '.npz')
+
+
+def source_stamp(plays_path, min_passes):
+    """What cached features were computed from, the plays file's size and mtime and the pass threshold"""
+    stat = os.stat(plays_path)
+    return np.array([stat.st_size, stat.st_mtime_ns, min_passes], dtype=np.int64)
+
+
+def is_cached(plays_path, cache_dir, min_passes=MIN_PASSES_IN_POSSESSION):
+    """Whether the cached features of a plays file exist and were computed from its current contents"""
+    cache_path = cache_path_of(plays_path, cache_dir)
+    if not os.path.exists(cache_path):
+        return False
+    with np.load(cache_path) as cached:
+        return np.array_equal(cached['_source'], source_stamp(plays_path, min_passes))
+
+
+def build_game(job):
+    """Computes and caches the features of one plays file, in a worker process"""
+    plays_path, cache_dir, min_passes = job
+    stamp = source_stamp(plays_path, min_passes)
+    with open(plays_path) as file:
+        columns = game_features(json.load(file), min_passes)
+    # Written next to the final place and renamed, an interrupted build never leaves half a cache file
+    fd, partial_path = tempfile.mkstemp(dir=cache_dir, prefix='.partial-')
+    with os.fdopen(fd, 'wb') as file:
+        np.savez(file, _source=stamp, **columns)
+    os.replace(partial_path, cache_path_of(plays_path, cache_dir))
+    return plays_path, len(columns['play'])
+
+
+def build_features(plays_dir='./data/plays_filtered/', cache_dir='./data/features/', workers=None, incremental=True,
+                   min_passes=MIN_PASSES_IN_POSSESSION):
+    """Returns the feature table of every game in plays_dir, one row per possession
+
+    The features of every game are cached in cache_dir. In incremental mode
+    only games that are new or changed since they were cached are computed,
+    on workers processes (all cores by default). The table is indexed by
+    (game, play) and has FEATURE_COLUMNS and label as columns.
+    """
+    import pandas as pd
+
+    os.makedirs(cache_dir, exist_ok=True)
+    plays_paths = sorted(glob(os.path.join(plays_dir, '*.json')))
+    stale = [path for path in plays_paths if not incremental or not is_cached(path, cache_dir, min_passes)]
+    if stale:
+        print(f"Computing features of {len(stale)} of {len(plays_paths)} games")
+        jobs = [(path, cache_dir, min_passes) for path in stale]
+        if workers == 1 or len(jobs) == 1:
+            for job in jobs:
+                build_game(job)
+        else:
+            with mp.Pool(min(workers or mp.cpu_count(), len(jobs))) as pool:
+                for _ in pool.imap_unordered(build_game, jobs):
+                    pass
+
+    games = []
+    columns = {name: [] for name in ['play'] + FEATURE_COLUMNS + ['label']}
+    for path in plays_paths:
+        with np.load(cache_path_of(path, cache_dir)) as cached:
+            for name, values in columns.items():
+                values.append(cached[name])
+        games.append(np.full(len(columns['play'][-1]), os.path.basename(path).rsplit('.', 1)[0], dtype=object))
+    if not plays_paths:
+        return pd.DataFrame(columns=FEATURE_COLUMNS + ['label'],
+                            index=pd.MultiIndex.from_arrays([[], []], names=['game', 'play']))
+    index = pd.MultiIndex.from_arrays([np.concatenate(games), np.concatenate(columns.pop('play'))],
+                                      names=['game', 'play'])
+    return pd.DataFrame({name: np.concatenate(values) for name, values in columns.items()}, index=index)
+
+
+def check_output(output_path):
+    """Raises ImportError when output_path is Parquet and neither pyarrow nor fastparquet is installed"""
+    if output_path.endswith('.csv'):
+        return
+    from importlib.util import find_spec
+
+    if find_spec('pyarrow') is None and find_spec('fastparquet') is None:
+        raise ImportError(f"Writing {output_path} needs pyarrow or fastparquet, install one of them "
+                          "or write a .csv instead")
+
+
+def write_features(features, output_path):
+    """Writes the feature table as Parquet (needs pyarrow or fastparquet), or as csv for a .csv path"""
+    check_output(output_path)
+    if output_path.endswith('.csv'):
+        features.to_csv(output_path)
+    else:
+        features.to_parquet(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the possession feature table of every game.')
+    parser.add_argument('--plays_dir', type=str, default='./data/plays_filtered/',
+                        help='Folder with the filtered plays of every game')
+    parser.add_argument('--cache_dir', type=str, default='./data/features/',
+                        help='Folder to cache the features of every game in')
+    parser.add_argument('--output', type=str, default='./data/features.parquet',
+                        help='Feature table to write, Parquet or .csv')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--full', action='store_true', help='Recompute the features of every game, not only new ones')
+    parser.add_argument('--min_passes', type=int, default=MIN_PASSES_IN_POSSESSION,
+                        help='Leave out possessions with fewer passes')
+    args = parser.parse_args()
+    # Fail before computing anything rather than after
+    try:
+        check_output(args.output)
+    except ImportError as e:
+        parser.error(str(e))
+
+    start = time.time()
+    features = build_features(args.plays_dir, args.cache_dir, args.workers, not args.full, args.min_passes)
+    write_features(features, args.output)
+    print(f"Wrote {len(features)} possessions to {args.output} in {time.time() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
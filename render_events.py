@@ -0,0 +1,137 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import pathlib
+import re
+import time
+import traceback
+
+import numpy as np
+
+from Event import FPS, Event
+from GameCache import GameCache
+from SharedTrajectory import SharedTrajectory
+from get_passing_data import load_session, str2bool
+
+# Player dictionary and the trajectory of the shared memory block a pool worker attached to
+_player_ids_dict = None
+_shared = None
+
+
+def _attach(spec, player_ids_dict):
+    global _player_ids_dict, _shared
+    _player_ids_dict = player_ids_dict
+    _shared = SharedTrajectory.attach(spec)
+
+
+def _render(job):
+    """Renders frames [start, stop) of the shared trajectory to output_path in a worker process"""
+    start, stop, output_path, fps, renderer = job
+    began = time.time()
+    try:
+        # Event draws on its own Agg canvas or frame buffer, so workers never touch a GUI backend
+        event = Event.from_trajectory(_shared[1][start:stop], _player_ids_dict)
+        event.save(output_path, fps=fps, renderer=renderer)
+    except Exception as e:
+        return output_path, stop - start, time.time() - began, f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+    return output_path, stop - start, time.time() - began, None
+
+
+def event_jobs(session, event_indices, game_name, output_dir, file_format):
+    """Frame ranges of the events in the game trajectory, and where to write them"""
+    offsets = session.event_offsets
+    return [(int(offsets[index]), int(offsets[index + 1]),
+             os.path.join(output_dir, f"{game_name}_Event{index}.{file_format}")) for index in event_indices]
+
+
+def play_jobs(timeline, plays, game_name, output_dir, file_format):
+    """Frame ranges of the plays in the deduplicated timeline, and where to write them
+
+    A play covers the frames of its quarter from SecLeft_From down to SecLeft_Until.
+    """
+    trajectory = timeline.trajectory
+    # The timeline is ordered by quarter, then by game clock counting down
+    keys = trajectory.quarter.astype(np.float64) * 10000 - trajectory.game_clock
+    jobs = []
+    for play in plays:
+        start = np.searchsorted(keys, play['Quarter'] * 10000 - play['SecLeft_From'], side='left')
+        stop = np.searchsorted(keys, play['Quarter'] * 10000 - play['SecLeft_Until'], side='right')
+        name = f"{game_name}_Q{play['Quarter']}_{play['SecLeft_From']}-{play['SecLeft_Until']}.{file_format}"
+        jobs.append((int(start), int(stop), os.path.join(output_dir, name)))
+    return jobs
+
+
+def render(trajectory, player_ids_dict, jobs, fps=FPS, workers=None, renderer='matplotlib'):
+    """Renders the (start, stop, output_path) jobs of trajectory in a process pool, yields their results
+
+    Workers read one shared memory copy of the trajectory, the longest jobs
+    are handed out first. Yields (output_path, frames, seconds, error), with
+    error None for the jobs that rendered.
+    """
+    jobs = sorted(((start, stop, output_path, fps, renderer) for start, stop, output_path in jobs),
+                  key=lambda job: job[1] - job[0], reverse=True)
+    if not jobs:
+        return
+    with SharedTrajectory(trajectory) as shared:
+        with mp.Pool(min(workers or mp.cpu_count(), len(jobs)), initializer=_attach,
+                     initargs=(shared.spec, dict(player_ids_dict))) as pool:
+            # chunksize 1 keeps the longest first order
+            yield from pool.imap_unordered(_render, jobs, chunksize=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render many events or plays of a game in parallel.')
+    parser.add_argument('--path', type=str, required=True, help='Path to the game json or .7z archive')
+    parser.add_argument('--events', type=int, nargs='*', default=None,
+                        help='Indices of the events to render, all events when given without indices')
+    parser.add_argument('--plays', type=str, default=None,
+                        help='Plays json of the game, e.g. data/plays_filtered/<game>.json, to render its plays')
+    parser.add_argument('--outcome', type=str, default=None,
+                        help='Only render the plays whose outcome matches this regular expression')
+    parser.add_argument('--output_dir', type=str, default='./data/videos/', help='Folder to write the animations to')
+    parser.add_argument('--format', type=str, default='gif', choices=['gif', 'mp4'],
+                        help='Animation format: gif written with Pillow, or mp4 written with ffmpeg')
+    parser.add_argument('--fps', type=int, default=FPS, help='Frames per second of the animations')
+    parser.add_argument('--renderer', type=str, default='matplotlib', choices=['matplotlib', 'raster'],
+                        help='How to draw the animations, raster is much faster but has no roster table')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--cache', type=str2bool, default=True, help='Reuse the parsed game from the game cache')
+    parser.add_argument('--cache_dir', type=str, default=GameCache.DEFAULT_DIR, help='Game cache folder')
+    args = parser.parse_args()
+    if (args.events is None) == (args.plays is None):
+        parser.error('render either --events or --plays')
+    if args.outcome is not None and args.plays is None:
+        parser.error('--outcome filters --plays')
+
+    session = load_session(args.path, args.cache, args.cache_dir)
+    game_name = ".".join(str(args.path).split('/')[-1].split('.')[:-1])
+    pathlib.Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    if args.plays is not None:
+        with open(args.plays) as file:
+            plays = json.load(file)
+        if args.outcome is not None:
+            plays = [play for play in plays if re.search(args.outcome, str(play['Outcome']))]
+        trajectory = session.timeline().trajectory
+        jobs = play_jobs(session.timeline(), plays, game_name, args.output_dir, args.format)
+    else:
+        trajectory = session.trajectory
+        jobs = event_jobs(session, args.events or range(len(session)), game_name, args.output_dir, args.format)
+    # Events without frames have nothing to draw
+    jobs = [job for job in jobs if job[1] > job[0]]
+    print(f"Rendering {len(jobs)} animations with {min(args.workers, len(jobs))} workers")
+
+    start = time.time()
+    failed = 0
+    for output_path, frames, seconds, error in render(trajectory, session.player_ids_dict, jobs, args.fps,
+                                                      args.workers, args.renderer):
+        if error is None:
+            print(f"{output_path} {frames} frames in {seconds:.1f}s")
+        else:
+            failed += 1
+            print("Failed", output_path, error)
+    print(f"Done in {time.time() - start:.1f}s, {failed} of {len(jobs)} failed")
+
+
+if __name__ == '__main__':
+    main()
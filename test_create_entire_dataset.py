@@ -0,0 +1,21 @@
+import os
+import signal
+
+from create_entire_dataset import run_games
+
+
+def run_or_die(job):
+    game_name, _, stages, _ = job
+    if game_name == 'killed':
+        os.kill(os.getpid(), signal.SIGKILL)
+    return game_name, {stage: {'status': 'done', 'seconds': 0} for stage in stages}
+
+
+def test_killed_worker_fails_its_game_and_the_run_goes_on():
+    names = ['a', 'b', 'killed', 'c', 'd', 'e']
+    results = dict(run_games([(name, None, ['passing', 'plays'], {}) for name in names], 2, run_or_die))
+    assert set(results) == set(names)
+    assert results['killed']['passing']['status'] == 'failed'
+    assert results['killed']['passing']['error'].startswith('BrokenProcessPool')
+    # Games after the broken pool run in a new one
+    assert results['e']['plays']['status'] == 'done'
@@ -0,0 +1,17 @@
+import numpy as np
+
+from get_passing_data import draw_gif
+from possession import determine_possessors
+from test_possession import GUEST_TEAM_ID, HOME_TEAM_ID, random_trajectory
+
+
+def test_draw_gif_without_ball(tmp_path):
+    trajectory = random_trajectory(20)
+    trajectory.positions[::3, 0] = np.nan
+    possessors = determine_possessors(trajectory, HOME_TEAM_ID, GUEST_TEAM_ID, 1, 5)
+    path = draw_gif(trajectory, possessors, HOME_TEAM_ID, GUEST_TEAM_ID, str(tmp_path / 'event.gif'))
+
+    from PIL import Image
+
+    with Image.open(path) as gif:
+        assert gif.n_frames == len(trajectory)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from Trajectory import Trajectory
+from possession import detect_passes_parallel, determine_possessors, get_pass_distances, segment_passes
+
+HOME_TEAM_ID = 1
+GUEST_TEAM_ID = 2
+
+
+def random_trajectory(frames, seed=0):
+    """Players walking around a ball that is often slow and low, with frames without a ball or a team"""
+    rng = np.random.default_rng(seed)
+    positions = np.cumsum(rng.normal(0, 0.6, (frames, Trajectory.ENTITIES, 3)), axis=0) % 50
+    positions[:, 0, 2] = rng.uniform(0, 8, frames)
+    positions[rng.random(frames) < 0.02, 0] = np.nan
+    team_ids = np.repeat([[0] + [HOME_TEAM_ID] * 5 + [GUEST_TEAM_ID] * 5], frames, axis=0)
+    team_ids[rng.random(frames) < 0.01, 6:] = 0
+    player_ids = np.repeat([np.arange(Trajectory.ENTITIES) * 10], frames, axis=0)
+    return Trajectory(np.ones(frames, dtype=np.int8), np.arange(frames, dtype=np.int64),
+                      720 - np.arange(frames) * 0.04, np.full(frames, 24.0), positions, team_ids, player_ids)
+
+
+@pytest.mark.parametrize('chunk_frames', [1, 7, 100, 1000, 5000])
+def test_parallel_detection_matches_serial(chunk_frames):
+    trajectory = random_trajectory(3000)
+    possessors = determine_possessors(trajectory, HOME_TEAM_ID, GUEST_TEAM_ID, 1, 5)
+    starts, stops = segment_passes(possessors)
+    distances = get_pass_distances(trajectory, starts, stops)
+    assert len(starts) > 100
+
+    parallel = detect_passes_parallel(trajectory, HOME_TEAM_ID, GUEST_TEAM_ID, 1, 5, workers=2,
+                                      chunk_frames=chunk_frames)
+    np.testing.assert_array_equal(parallel[0], possessors)
+    np.testing.assert_array_equal(parallel[1], starts)
+    np.testing.assert_array_equal(parallel[2], stops)
+    np.testing.assert_allclose(parallel[3], distances, rtol=1e-9, atol=1e-9)
+
+
+def test_parallel_detection_without_frames():
+    possessors, starts, stops, distances = detect_passes_parallel(random_trajectory(0), HOME_TEAM_ID, GUEST_TEAM_ID,
+                                                                  1, 5, workers=2)
+    assert len(possessors) == len(starts) == len(stops) == len(distances) == 0
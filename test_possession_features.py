@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+
+from pass_graphs import defensive_metrics
+from possession_features import FEATURE_COLUMNS, build_features, game_features
+
+
+def snapshot(home, guest):
+    return {'Ball': {'x': 0.0, 'y': 0.0},
+            'HomePlayers': {name: {'x': 1.0 + i, 'y': 2.0} for i, name in enumerate(home)},
+            'GuestPlayers': {name: {'x': 3.0 + i, 'y': 4.0} for i, name in enumerate(guest)}}
+
+
+def possession(passes, home=('a', 'b'), guest=('c', 'd')):
+    # Passes between home players a and b
+    return {'Weight': 1, 'CombinedPasses': [{'pass_from': 'ab'[i % 2], 'pass_to': 'ab'[(i + 1) % 2],
+                                             'snapshots': [snapshot(home, guest)]} for i in range(passes)]}
+
+
+def assert_empty(columns):
+    assert set(columns) == {'play', 'label', *FEATURE_COLUMNS}
+    assert all(len(values) == 0 for values in columns.values())
+
+
+def test_defensive_metrics_without_nodes():
+    metrics = defensive_metrics(np.zeros((2, 0, 0)), np.zeros(2, dtype=np.int64))
+    assert np.isnan(metrics['def_max_pagerank']).all()
+    assert np.isnan(metrics['def_dist_from_ball']).all()
+    assert (metrics['def_edge_sum'] == 0).all()
+
+
+def test_game_without_qualifying_possessions():
+    assert_empty(game_features([]))
+    # Too few passes
+    assert_empty(game_features([possession(2)]))
+    # Empty rosters leave the defending team unknown
+    assert_empty(game_features([possession(5, home=(), guest=())]))
+
+
+def test_game_with_a_possession():
+    columns = game_features([possession(2), possession(5)])
+    assert columns['play'].tolist() == [1]
+    assert columns['numpasses'].tolist() == [5]
+
+
+def test_build_features_with_an_empty_game(tmp_path):
+    plays_dir = tmp_path / 'plays'
+    plays_dir.mkdir()
+    (plays_dir / 'empty.json').write_text(json.dumps([]))
+    (plays_dir / 'game.json').write_text(json.dumps([possession(5)]))
+    features = build_features(str(plays_dir), str(tmp_path / 'cache'), workers=2)
+    assert features.index.tolist() == [('game', 0)]
+
+
+def test_min_passes_invalidates_the_cache(tmp_path):
+    plays_dir = tmp_path / 'plays'
+    plays_dir.mkdir()
+    (plays_dir / 'game.json').write_text(json.dumps([possession(3), possession(5)]))
+    assert len(build_features(str(plays_dir), str(tmp_path / 'cache'), workers=1)) == 2
+    assert len(build_features(str(plays_dir), str(tmp_path / 'cache'), workers=1, min_passes=4)) == 1